@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Meeting, Topic, Caller
+from .pins import allocate_pin
 
 
 class TopicInline(admin.StackedInline):
@@ -18,5 +19,11 @@ class MeetingAdmin(admin.ModelAdmin):
     fields = ['room_name', 'room_id', 'complete_id']
     inlines = [TopicInline, CallerInline]
 
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.voice_id = allocate_pin()
+
+        super(MeetingAdmin, self).save_model(request, obj, form, change)
+
 
 admin.site.register(Meeting, MeetingAdmin)
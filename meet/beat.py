@@ -0,0 +1,86 @@
+import logging
+import socket
+import uuid
+
+from celery.beat import PersistentScheduler
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from spark.helpers import get_redis
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+LEADER_KEY = 'meet:beat:leader'
+
+# Extends the lease only while this node still holds it
+RENEW_SCRIPT = '''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+'''
+
+RELEASE_SCRIPT = '''
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+'''
+
+
+class LeaderScheduler(PersistentScheduler):
+    def __init__(self, *args, **kwargs):
+        self.token = '{0}:{1}'.format(socket.gethostname(), uuid.uuid4().hex)
+        self.leader = False
+        self._renew = None
+        self._release = None
+        super(LeaderScheduler, self).__init__(*args, **kwargs)
+
+    def elect(self):
+        redis = get_redis()
+        timeout = settings.BEAT_LEADER_TIMEOUT
+
+        if self._renew is None:
+            self._renew = redis.register_script(RENEW_SCRIPT)
+            self._release = redis.register_script(RELEASE_SCRIPT)
+
+        try:
+            if self.leader:
+                leader = bool(self._renew(keys=[LEADER_KEY], args=[self.token, timeout]))
+            else:
+                leader = bool(redis.set(LEADER_KEY, self.token, nx=True, ex=timeout))
+        except RedisError:
+            # Without Redis there is no way to prove the lease is still ours
+            logger.exception('Unable to reach Redis for beat leader election')
+            leader = False
+
+        if leader != self.leader:
+            if leader:
+                logger.info('Beat leadership acquired by %s', self.token)
+                metrics.incr('beat.elected')
+            else:
+                logger.warning('Beat leadership lost by %s', self.token)
+                metrics.incr('beat.demoted')
+
+        self.leader = leader
+        return leader
+
+    def tick(self, *args, **kwargs):
+        heartbeat = settings.BEAT_LEADER_HEARTBEAT
+
+        if not self.elect():
+            return heartbeat
+
+        return min(super(LeaderScheduler, self).tick(*args, **kwargs), heartbeat)
+
+    def close(self):
+        if self.leader:
+            try:
+                self._release(keys=[LEADER_KEY], args=[self.token])
+            except RedisError:
+                logger.exception('Unable to release beat leadership')
+
+            self.leader = False
+
+        super(LeaderScheduler, self).close()
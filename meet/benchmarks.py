@@ -0,0 +1,310 @@
+import importlib
+import json
+import os
+import threading
+import time
+import timeit
+from unittest import mock
+
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+
+from kombu.serialization import dumps, loads
+
+from spark.celery import app
+from spark.helpers import get_redis
+from . import codec, pins, scheduler
+from .commands import parse_command
+from .hooks import voice_validate
+from .models import Meeting
+from .tasks import stage_meeting
+from .tropo import Result, Session, Tropo
+
+# Run explicitly with: python manage.py test meet.benchmarks
+
+NUMBER = 2000
+
+
+def report(name, seconds, number=NUMBER):
+    print('{0}: {1:.1f} us/op'.format(name, seconds / number * 1e6))
+
+
+def create_meetings(count, offset=0):
+    Meeting.objects.bulk_create(
+        Meeting(room_name='Room {0}'.format(i), room_id='room-{0}'.format(i), voice_id=str(100000 + i))
+        for i in range(offset, offset + count)
+    )
+
+
+def get_result_body(voice_id):
+    return json.dumps({
+        'result': {
+            'sessionId': 'f5b36187c8dd47278b2ff9c447f29046',
+            'state': 'ANSWERED',
+            'actions': {'name': 'meeting_id', 'interpretation': voice_id}
+        }
+    })
+
+
+def get_backends():
+    backends = []
+
+    for name in codec.BACKENDS:
+        try:
+            backends.append(importlib.import_module(name))
+        except ImportError:
+            pass
+
+    return backends
+
+
+def get_voice_next_document():
+    tropo = Tropo()
+    tropo.say('Current topic: Quarterly roadmap review')
+    tropo.conference(id='4821', terminator='*', allowSignals=['next', 'exit'])
+    tropo.on(event='continue', next='https://meet.example.com/voice/next/42/')
+    tropo.on(event='next', next='https://meet.example.com/voice/next/42/')
+    tropo.on(event='hangup', next='https://meet.example.com/voice/hangup/42/')
+    tropo.on(event='exit', next='https://meet.example.com/voice/hangup/42/')
+    return json.loads(tropo.RenderJson())
+
+
+def get_message_page():
+    return {
+        'items': [
+            {
+                'id': 'Y2lzY29zcGFyazovL3VzL01FU1NBR0UvOTJkYjNiZTAtNDNiZC0xMWU2LThhZTktZGQ1YjNkZmM1NjVk{0}'.format(i),
+                'roomId': 'Y2lzY29zcGFyazovL3VzL1JPT00vYmJjZWIxYWQtNDNmMS0zYjU4LTkxNDctZjE0YmIwYzRkMTU0',
+                'roomType': 'group',
+                'text': '/meet15 Roadmap, Hiring, Budget, Retro',
+                'personId': 'Y2lzY29zcGFyazovL3VzL1BFT1BMRS9mNWIzNjE4Ny1jOGRkLTQ3MjctOGIyZi1mOWM0NDdmMjkwNDY',
+                'personEmail': 'person{0}@example.com'.format(i),
+                'created': '2016-03-17T02:58:00.000Z'
+            }
+            for i in range(50)
+        ]
+    }
+
+
+def get_transcription():
+    return {
+        'result': {
+            'identifier': 'f5b36187c8dd47278b2ff9c447f29046',
+            'transcription': 'We agreed to move the launch to the second week of April. ' * 20
+        }
+    }
+
+
+class CodecBenchmark(SimpleTestCase):
+    payloads = (
+        ('voice_next', get_voice_next_document),
+        ('message_page', get_message_page),
+        ('transcription', get_transcription),
+    )
+
+    def test_backends(self):
+        for name, get_payload in self.payloads:
+            payload = get_payload()
+            text = json.dumps(payload)
+
+            for backend in get_backends():
+                self.assertEqual(backend.loads(backend.dumps(payload)), payload)
+
+                report('{0} {1}.dumps'.format(name, backend.__name__),
+                       timeit.timeit(lambda: backend.dumps(payload), number=NUMBER))
+                report('{0} {1}.loads'.format(name, backend.__name__),
+                       timeit.timeit(lambda: backend.loads(text), number=NUMBER))
+
+    def test_documents_match_standard_library(self):
+        document = get_voice_next_document()
+        self.assertEqual(codec.dumps_document(document), json.dumps(document))
+
+
+class StagingOccupancyBenchmark(TestCase):
+    # Staging should cost the worker the same few milliseconds however many meetings are staged
+    sizes = (10, 100, 1000)
+
+    @mock.patch.dict(os.environ, {'TROPO_PHONE_NUMBER': '+15555550100', 'SIP_NUMBER': 'meet@example.com'})
+    @mock.patch('meet.tasks.send_message')
+    def test_occupancy_per_staged_meeting(self, send_message):
+        for size in self.sizes:
+            Meeting.objects.all().delete()
+            create_meetings(size)
+            meeting_pks = list(Meeting.objects.values_list('pk', flat=True))
+
+            started = time.time()
+
+            for meeting_pk in meeting_pks:
+                stage_meeting(meeting_pk)
+
+            elapsed = time.time() - started
+
+            for meeting_pk in meeting_pks:
+                scheduler.cancel(meeting_pk)
+
+            report('stage_meeting with {0} staged'.format(size), elapsed, size)
+            self.assertLess(elapsed / size, 1)
+
+
+class ParseCommandBenchmark(SimpleTestCase):
+    # Mostly chatter, as in a real room, with the occasional command
+    corpus = (
+        'Morning all, running five minutes late',
+        'Can someone share the deck from yesterday?',
+        'Thanks!',
+        'I think we should push the launch to April',
+        'https://example.com/docs/roadmap',
+        '/meet10 Roadmap, Hiring, Budget',
+        'lol',
+        '/status',
+        'Agreed, let us take that offline',
+        '/next',
+    )
+
+    def test_corpus(self):
+        number = NUMBER * 10
+
+        def parse_corpus():
+            for text in self.corpus:
+                parse_command(text)
+
+        report('parse_command per message', timeit.timeit(parse_corpus, number=number), number * len(self.corpus))
+
+
+class VoiceValidateBenchmark(TestCase):
+    # The indexed lookup should keep the per-call latency flat as the table grows
+    sizes = (10, 1000, 100000)
+
+    @mock.patch.dict(os.environ, {'DOMAIN_URL': 'https://meet.example.com'})
+    def test_latency_by_meeting_count(self):
+        factory = RequestFactory()
+        number = 200
+        created = 0
+
+        for size in self.sizes:
+            create_meetings(size - created, offset=created)
+            created = size
+
+            body = get_result_body(str(100000 + size // 2))
+
+            def validate():
+                voice_validate(factory.post('/home/voice/validate', body, content_type='application/json'))
+
+            report('voice_validate with {0} meetings'.format(size), timeit.timeit(validate, number=number), number)
+
+
+class PinAllocationBenchmark(TransactionTestCase):
+    threads = 8
+    meetings_per_thread = 250
+
+    def setUp(self):
+        get_redis().delete(pins.FREE_PINS_KEY)
+
+    def tearDown(self):
+        get_redis().delete(pins.FREE_PINS_KEY)
+
+    def test_concurrent_meeting_creation(self):
+        def create():
+            try:
+                for i in range(self.meetings_per_thread):
+                    room = {'id': 'room', 'title': 'Room'}
+                    Meeting.create(room=room, meeting_length=10, topic_count=2, spark_audio=False).save()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=create) for _ in range(self.threads)]
+        started = time.time()
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.time() - started
+        count = self.threads * self.meetings_per_thread
+
+        report('Meeting.create with {0} concurrent creators'.format(self.threads), elapsed, count)
+        self.assertEqual(Meeting.objects.values('voice_id').distinct().count(), count)
+
+
+class TropoBenchmark(SimpleTestCase):
+    def test_actions(self):
+        actions = (
+            ('ask', lambda tropo: tropo.ask(attempts=3, say='Please enter meeting ID', choices='[4 DIGITS]', timeout=10)),
+            ('on', lambda tropo: tropo.on(event='continue', next='https://meet.example.com/voice/next/42/')),
+            ('conference', lambda tropo: tropo.conference(id='4821', terminator='*', allowSignals=['next', 'exit'])),
+            ('say', lambda tropo: tropo.say('Current topic: Quarterly roadmap review')),
+        )
+
+        for name, action in actions:
+            report('Tropo.{0}'.format(name), timeit.timeit(lambda: action(Tropo()), number=NUMBER))
+
+    def test_render_json(self):
+        tropo = Tropo()
+        tropo.say('Current topic: Quarterly roadmap review')
+        tropo.conference(id='4821', terminator='*', allowSignals=['next', 'exit'])
+        tropo.on(event='continue', next='https://meet.example.com/voice/next/42/')
+        tropo.on(event='hangup', next='https://meet.example.com/voice/hangup/42/')
+
+        report('Tropo.RenderJson', timeit.timeit(tropo.RenderJson, number=NUMBER))
+
+    def test_result(self):
+        body = get_result_body('4821')
+        report('Result', timeit.timeit(lambda: Result(body).getValue(), number=NUMBER))
+
+    def test_session(self):
+        body = json.dumps({
+            'session': {
+                'id': 'f5b36187c8dd47278b2ff9c447f29046',
+                'accountId': '5050915',
+                'timestamp': '2016-03-17T02:58:00.000Z',
+                'userType': 'HUMAN',
+                'initialText': None,
+                'callId': '9fb8a1b1f1d4c8f2',
+                'to': {'id': '15555550100', 'channel': 'VOICE', 'network': 'SIP'},
+                'from': {'id': '15555550123', 'channel': 'VOICE', 'network': 'SIP'},
+                'headers': {'Via': 'SIP/2.0/UDP 10.6.93.101:5060', 'Content-Length': '247'}
+            }
+        })
+
+        report('Session', timeit.timeit(lambda: Session(body), number=NUMBER))
+
+
+class TaskPayloadBenchmark(TestCase):
+    # Before: whole Meeting instances pickled into each message, after: ids serialized as JSON
+    def setUp(self):
+        self.meeting = Meeting.objects.create(room_name='Room', room_id='room', voice_id='990001')
+
+    def get_payloads(self):
+        return (
+            ('pickled instance', 'pickle', {'args': [self.meeting], 'kwargs': {}}),
+            ('json ids', 'json', {'args': [self.meeting.pk], 'kwargs': {}}),
+        )
+
+    def test_message_size_and_serialization(self):
+        for name, serializer, payload in self.get_payloads():
+            content_type, encoding, body = dumps(payload, serializer=serializer)
+            print('{0}: {1} bytes'.format(name, len(body)))
+
+            report('{0} round trip'.format(name), timeit.timeit(
+                lambda: loads(dumps(payload, serializer=serializer)[2], content_type, encoding),
+                number=NUMBER
+            ))
+
+    def test_enqueue_dequeue_latency(self):
+        number = 200
+
+        with app.connection() as conn:
+            queue = conn.SimpleQueue('meet.benchmark')
+
+            try:
+                for name, serializer, payload in self.get_payloads():
+                    def round_trip():
+                        queue.put(payload, serializer=serializer)
+                        queue.get(timeout=5).ack()
+
+                    report('{0} enqueue and dequeue'.format(name), timeit.timeit(round_trip, number=number), number)
+            finally:
+                queue.clear()
+                queue.close()
@@ -0,0 +1,187 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from redis.exceptions import RedisError
+from requests.exceptions import RequestException
+
+from spark.helpers import get_redis
+from . import codec, metrics
+from .calls import get_my_details, get_room_details
+
+logger = logging.getLogger(__name__)
+
+ROOM_KEY = 'meet:room:{0}'
+MESSAGE_KEY = 'meet:message:{0}'
+BOT_PERSON_KEY = 'meet:bot:person_id'
+VOICE_RESPONSE_KEY = 'meet:voice_next:{0}'
+
+BOT_PERSON_RETRY = 60
+
+
+class TTLCache(object):
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._items[key]
+            except KeyError:
+                return default
+
+            if expires < time.time():
+                del self._items[key]
+                return default
+
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+_rooms = TTLCache(maxsize=settings.ROOM_CACHE_SIZE, ttl=settings.ROOM_CACHE_LOCAL_TTL)
+_messages = TTLCache(maxsize=settings.WEBHOOK_DEDUP_SIZE, ttl=settings.WEBHOOK_DEDUP_TTL)
+_voice_responses = TTLCache(maxsize=settings.VOICE_RESPONSE_CACHE_SIZE, ttl=settings.VOICE_RESPONSE_CACHE_TTL)
+_bot_person_id = None
+_bot_person_retry_at = 0
+
+
+def get_room(room_id):
+    room = _rooms.get(room_id)
+
+    if room is not None:
+        metrics.count('room_cache.local_hit')
+        return room
+
+    key = ROOM_KEY.format(room_id)
+
+    try:
+        cached = get_redis().get(key)
+    except RedisError:
+        logger.exception('Unable to read room %s from the shared cache', room_id)
+        cached = None
+
+    if cached:
+        metrics.count('room_cache.shared_hit')
+        room = codec.loads(cached)
+    else:
+        metrics.count('room_cache.miss')
+        room = get_room_details(room_id)
+
+        # Error payloads from Spark have no id and must not be cached
+        if 'id' not in room:
+            return room
+
+        try:
+            get_redis().setex(key, settings.ROOM_CACHE_TTL, codec.dumps(room))
+        except RedisError:
+            logger.exception('Unable to write room %s to the shared cache', room_id)
+
+    _rooms.set(room_id, room)
+    return room
+
+
+def invalidate_room(room_id):
+    _rooms.delete(room_id)
+
+    try:
+        get_redis().delete(ROOM_KEY.format(room_id))
+    except RedisError:
+        logger.exception('Unable to invalidate room %s', room_id)
+
+
+def claim_message(message_id):
+    if _messages.get(message_id):
+        return False
+
+    _messages.set(message_id, True)
+
+    try:
+        return bool(get_redis().set(MESSAGE_KEY.format(message_id), 1, nx=True, ex=settings.WEBHOOK_DEDUP_TTL))
+    except RedisError:
+        logger.exception('Unable to claim message %s', message_id)
+        return True
+
+
+def release_message(message_id):
+    _messages.delete(message_id)
+
+    try:
+        get_redis().delete(MESSAGE_KEY.format(message_id))
+    except RedisError:
+        logger.exception('Unable to release message %s', message_id)
+
+
+def get_bot_person_id(fetch=True):
+    global _bot_person_id, _bot_person_retry_at
+
+    if _bot_person_id is None:
+        try:
+            _bot_person_id = get_redis().get(BOT_PERSON_KEY)
+        except RedisError:
+            logger.exception('Unable to read the bot person id')
+
+    # A failed lookup is not repeated for every event, an unknown id just means nothing is skipped
+    if _bot_person_id is None and fetch and time.time() >= _bot_person_retry_at:
+        try:
+            _bot_person_id = get_my_details().get('id')
+        except (RequestException, ValueError):
+            logger.exception('Unable to look up the bot person id')
+
+        if _bot_person_id:
+            try:
+                get_redis().set(BOT_PERSON_KEY, _bot_person_id)
+            except RedisError:
+                logger.exception('Unable to store the bot person id')
+        else:
+            _bot_person_retry_at = time.time() + BOT_PERSON_RETRY
+
+    return _bot_person_id
+
+
+def get_voice_response(key, render):
+    response = _voice_responses.get(key)
+
+    if response is not None:
+        metrics.count('voice_next.local_hit')
+        return response
+
+    redis_key = VOICE_RESPONSE_KEY.format(key)
+
+    try:
+        response = get_redis().get(redis_key)
+    except RedisError:
+        logger.exception('Unable to read voice response %s', key)
+
+    if response is not None:
+        metrics.count('voice_next.shared_hit')
+    else:
+        metrics.count('voice_next.miss')
+
+        started = time.time()
+        response = render()
+        metrics.timing('voice_next.render', time.time() - started)
+
+        try:
+            get_redis().setex(redis_key, settings.VOICE_RESPONSE_CACHE_TTL, response)
+        except RedisError:
+            logger.exception('Unable to write voice response %s', key)
+
+    _voice_responses.set(key, response)
+    return response
@@ -1,10 +1,13 @@
-import json
+import logging
 import os
 
-import requests
+from django.conf import settings
 from django.core.urlresolvers import reverse
 
 from spark.helpers import get_full_url
+from . import client, codec, metrics
+
+logger = logging.getLogger(__name__)
 
 SPARK_HEADERS = {
     'Authorization': 'Bearer {0}'.format(os.environ['SPARK_TOKEN'])
@@ -16,12 +19,29 @@ TROPO_HEADERS = {
 }
 
 
+# Spark pagination
+
+def get_items(url, params=None, page_size=None):
+    params = dict(params or {})
+    params['max'] = page_size or settings.SPARK_PAGE_SIZE
+
+    while url:
+        r = client.get(url, params=params, headers=SPARK_HEADERS)
+
+        for item in codec.loads(r.content)['items']:
+            yield item
+
+        # The next link already carries the query string
+        url = r.links.get('next', {}).get('url')
+        params = None
+
+
 # Spark Message calls
 
 def get_message_details(message_id):
     url = 'https://api.ciscospark.com/v1/messages/{0}'.format(message_id)
-    r = requests.get(url, headers=SPARK_HEADERS)
-    return r.json()
+    r = client.get(url, headers=SPARK_HEADERS)
+    return codec.loads(r.content)
 
 
 def send_message(text, room_id, file_url=None):
@@ -41,47 +61,51 @@ def send_message(text, room_id, file_url=None):
     headers = SPARK_HEADERS.copy()
     headers['content-type'] = 'application/json'
 
-    r = requests.post(url, data=json.dumps(data), headers=headers)
-    return r.json()
+    r = client.post(url, data=codec.dumps(data), headers=headers)
+    return codec.loads(r.content)
+
+
+# Spark People calls
+
+def get_my_details():
+    url = 'https://api.ciscospark.com/v1/people/me'
+    r = client.get(url, headers=SPARK_HEADERS)
+    return codec.loads(r.content)
 
 
 # Spark Room calls
 
-def get_rooms():
+def get_rooms(page_size=None):
     url = 'https://api.ciscospark.com/v1/rooms'
-    r = requests.get(url, headers=SPARK_HEADERS)
-    return r.json()['items']
+    return get_items(url, page_size=page_size)
 
 
 def get_room_details(room_id):
     url = 'https://api.ciscospark.com/v1/rooms/{0}?showSipAddress=true'.format(room_id)
-    r = requests.get(url, headers=SPARK_HEADERS)
-    return r.json()
+    r = client.get(url, headers=SPARK_HEADERS)
+    return codec.loads(r.content)
 
 
-def get_room_messages(room_id):
-    url = 'https://api.ciscospark.com/v1/messages?roomId={0}'.format(room_id)
-    r = requests.get(url, headers=SPARK_HEADERS)
-    return r.json()['items']
+def get_room_messages(room_id, page_size=None):
+    url = 'https://api.ciscospark.com/v1/messages'
+    return get_items(url, params={'roomId': room_id}, page_size=page_size)
 
 
-def get_room_memberships(room_id):
-    url = 'https://api.ciscospark.com/v1/memberships?roomId={0}'.format(room_id)
-    r = requests.get(url, headers=SPARK_HEADERS)
-    return r.json()['items']
+def get_room_memberships(room_id, page_size=None):
+    url = 'https://api.ciscospark.com/v1/memberships'
+    return get_items(url, params={'roomId': room_id}, page_size=page_size)
 
 
 def delete_room(room_id):
     url = 'https://api.ciscospark.com/v1/rooms/{0}'.format(room_id)
-    requests.delete(url, headers=SPARK_HEADERS)
+    client.delete(url, headers=SPARK_HEADERS)
 
 
 # Spark Webhook calls
 
-def get_webhooks():
+def get_webhooks(page_size=None):
     url = 'https://api.ciscospark.com/v1/webhooks'
-    r = requests.get(url, headers=SPARK_HEADERS)
-    return r.json()['items']
+    return get_items(url, page_size=page_size)
 
 
 def create_webhook(name, room_id):
@@ -95,14 +119,26 @@ def create_webhook(name, room_id):
         'filter': 'roomId={0}'.format(room_id)
     }
 
-    requests.post(url, data=data, headers=SPARK_HEADERS)
+    client.post(url, data=data, headers=SPARK_HEADERS)
 
 
 # Tropo calls
 
 def send_signal(session_id, signal):
     url = 'https://api.tropo.com/1.0/sessions/{0}/signals?action=signal&value={1}'.format(session_id, signal)
-    requests.post(url, headers=TROPO_HEADERS)
+    client.post(url, headers=TROPO_HEADERS).raise_for_status()
+
+
+def send_signals(session_ids, signal):
+    fan_out = client.fan_out(lambda session_id: send_signal(session_id, signal), session_ids)
+
+    for session_id, error in fan_out.failures.items():
+        logger.warning('Unable to send %s signal to session %s: %s', signal, session_id, error)
+
+    metrics.timing('signals.fan_out', fan_out.latency)
+    metrics.incr('signals.failed', len(fan_out.failures))
+
+    return fan_out
 
 
 def create_session(sip_address, message):
@@ -114,4 +150,4 @@ def create_session(sip_address, message):
         'msg': message
     }
 
-    return requests.post(url, data=json.dumps(data), headers=TROPO_HEADERS).content
+    return client.post(url, data=codec.dumps(data), headers=TROPO_HEADERS).content
@@ -0,0 +1,119 @@
+import logging
+import random
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectTimeout, RequestException
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+TOO_MANY_REQUESTS = 429
+
+FanOut = namedtuple('FanOut', ['results', 'failures', 'latency'])
+
+_sessions = {}
+
+
+def get_session(url):
+    host = urlsplit(url).netloc
+    session = _sessions.get(host)
+
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.HTTP_POOL_SIZE)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session = _sessions.setdefault(host, session)
+
+    return session
+
+
+def get_backoff(attempt):
+    return random.uniform(0, min(settings.HTTP_BACKOFF_MAX, settings.HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+def get_retry_after(response, attempt):
+    try:
+        return min(float(response.headers['Retry-After']), settings.HTTP_BACKOFF_MAX)
+    except (KeyError, ValueError):
+        return get_backoff(attempt)
+
+
+def request(method, url, idempotent=None, **kwargs):
+    method = method.upper()
+
+    if idempotent is None:
+        idempotent = method in IDEMPOTENT_METHODS
+
+    kwargs.setdefault('timeout', (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT))
+    session = get_session(url)
+    attempt = 0
+
+    while True:
+        try:
+            response = session.request(method, url, **kwargs)
+        except RequestException as error:
+            # A connect timeout means the request never reached the server
+            retryable = idempotent or isinstance(error, ConnectTimeout)
+
+            if not retryable or attempt >= settings.HTTP_MAX_RETRIES:
+                raise
+
+            delay = get_backoff(attempt)
+            logger.warning('%s %s failed (%s), retrying in %.2fs', method, url, error, delay)
+        else:
+            # A 429 was rejected before processing, so it is safe to retry for any method
+            if response.status_code == TOO_MANY_REQUESTS:
+                delay = get_retry_after(response, attempt)
+            elif idempotent and response.status_code in RETRY_STATUS_CODES:
+                delay = get_backoff(attempt)
+            else:
+                return response
+
+            if attempt >= settings.HTTP_MAX_RETRIES:
+                return response
+
+            logger.warning('%s %s returned %s, retrying in %.2fs', method, url, response.status_code, delay)
+
+        time.sleep(delay)
+        attempt += 1
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request('DELETE', url, **kwargs)
+
+
+def fan_out(func, items, max_workers=None):
+    items = list(items)
+    results = {}
+    failures = {}
+    started = time.time()
+
+    if items:
+        max_workers = min(max_workers or settings.HTTP_FAN_OUT_WORKERS, len(items))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = dict((executor.submit(func, item), item) for item in items)
+
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as error:
+                    failures[futures[future]] = error
+
+    return FanOut(results, failures, time.time() - started)
@@ -0,0 +1,46 @@
+import importlib
+import json
+
+from django.conf import settings
+
+BACKENDS = ('ujson', 'simplejson', 'json')
+
+
+def load_backend(name):
+    if name != 'auto':
+        return importlib.import_module(name)
+
+    for backend in BACKENDS:
+        try:
+            return importlib.import_module(backend)
+        except ImportError:
+            pass
+
+
+backend = load_backend(settings.JSON_CODEC)
+
+
+def dumps(obj, **kwargs):
+    # Formatting options such as indent are only guaranteed by the standard library
+    if kwargs:
+        return json.dumps(obj, **kwargs)
+
+    if backend.__name__ == 'ujson':
+        return backend.dumps(obj, escape_forward_slashes=False)
+
+    return backend.dumps(obj)
+
+
+def dumps_document(obj):
+    # Tropo documents stay byte-identical to the standard library, which ujson's compact output is not
+    if backend.__name__ == 'simplejson':
+        return backend.dumps(obj)
+
+    return json.dumps(obj)
+
+
+def loads(data):
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+
+    return backend.loads(data)
@@ -0,0 +1,39 @@
+import re
+from collections import namedtuple
+
+HELP = 'help'
+MEET = 'meet'
+START = 'start'
+STATUS = 'status'
+NEXT = 'next'
+CANCEL = 'cancel'
+
+COMMAND_PATTERN = re.compile(r'(?i)^/+(?P<word>MEET|START|STATUS|NEXT|CANCEL)(?P<parameters>.*)')
+MEET_PARAMETERS_PATTERN = re.compile(r'(?i)^(?P<sip>|\$)(?P<time>|\!|[0-9]+)\s(?P<topics>.*)')
+
+Command = namedtuple('Command', ['name', 'parameters'])
+
+
+def parse_command(text):
+    if not text or text[0] != '/':
+        return None
+
+    match = COMMAND_PATTERN.match(text)
+
+    if not match:
+        return None
+
+    name = match.group('word').lower()
+    parameters = match.group('parameters')
+    complete = text[match.end():] in ('', '\n')
+
+    if name == MEET:
+        if parameters == '?' and complete:
+            return Command(HELP, None)
+
+        return Command(MEET, parameters)
+
+    if parameters or not complete:
+        return None
+
+    return Command(name, None)
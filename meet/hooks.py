@@ -1,8 +1,7 @@
-import json
-
+import re
 from datetime import datetime
-from io import BytesIO
 
+from django.conf import settings
 from django.core.urlresolvers import reverse
 from django.http import HttpResponse, Http404
 from django.views.decorators.csrf import csrf_exempt
@@ -11,43 +10,125 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from spark.helpers import get_full_url
-from .models import Meeting, MeetingTranscription, Caller, Topic
+from . import codec, live, metrics
+from .cache import claim_message, get_bot_person_id, get_voice_response, release_message
+from .models import Meeting, Caller, Topic
+from .parsers import CodecJSONParser
 from .serializers import WebhookSerializer
-from .tasks import route_request
+from .tasks import prerender_transcript, process_webhook
+from .transcripts import get_pdf, render_pdf
 from .tropo import Tropo, Result
 
 
+WEBHOOK_QUEUE = settings.CELERY_QUEUES_INTERACTIVE
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+if settings.VOICE_ID_FALLBACK:
+    VOICE_ID_CHOICES = '[4-{0} DIGITS]'.format(settings.VOICE_ID_FALLBACK_DIGITS)
+else:
+    VOICE_ID_CHOICES = '[4 DIGITS]'
+
+
 # Spark Webhook
 
 class Webhook(APIView):
+    parser_classes = (CodecJSONParser,)
+
     def post(self, request, format=None):
         serializer = WebhookSerializer(data=request.data)
         if serializer.is_valid():
-            route_request(
-                resource=serializer.data['resource'],
-                event=serializer.data['event'],
-                data=serializer.data['data']
-            )
+            data = serializer.data['data']
+            message_id = data.get('id')
+
+            # Messages posted by the bot itself are never commands, the id is resolved by the workers
+            if data.get('personId') and data['personId'] == get_bot_person_id(fetch=False):
+                metrics.incr('webhooks.bot_messages_skipped')
+                return Response(None, status=status.HTTP_202_ACCEPTED)
+
+            # Spark retries deliveries, so a message is only processed once
+            if message_id and not claim_message(message_id):
+                metrics.incr('webhooks.duplicates')
+                return Response(None, status=status.HTTP_202_ACCEPTED)
+
+            try:
+                process_webhook.delay(
+                    resource=serializer.data['resource'],
+                    event=serializer.data['event'],
+                    data=data
+                )
+            except Exception:
+                # Spark's retry of this delivery must not be dropped as a duplicate
+                if message_id:
+                    release_message(message_id)
+
+                raise
+
+            metrics.record_queue_depth(WEBHOOK_QUEUE)
             return Response(None, status=status.HTTP_202_ACCEPTED)
         return Response(None, status=status.HTTP_400_BAD_REQUEST)
 
 
 # Spark PDF Request
 
+def get_byte_range(header, length):
+    match = RANGE_PATTERN.match(header)
+
+    if not match or not any(match.groups()):
+        return None
+
+    start, end = match.groups()
+
+    if not start:
+        return max(length - int(end), 0), length - 1
+
+    start = int(start)
+    end = min(int(end), length - 1) if end else length - 1
+
+    # Unsatisfiable starts are reported by the caller, inverted ranges are ignored
+    if end < start and start < length:
+        return None
+
+    return start, end
+
+
 def meeting_pdf(request, meeting_pk):
-    try:
-        meeting = Meeting.objects.get(id=meeting_pk)
+    digest, pdf = get_pdf(meeting_pk)
+
+    if pdf is None:
+        try:
+            meeting = Meeting.objects.get(id=meeting_pk)
+        except Meeting.DoesNotExist:
+            raise Http404
+
+        digest, pdf = render_pdf(meeting)
 
-        filename = 'Meeting Transcription-{0}.pdf'.format(datetime.now())
-        buffer = BytesIO()
-        meeting_transcription = MeetingTranscription(meeting=meeting, buffer=buffer)
-        pdf = meeting_transcription.create_pdf()
+    etag = '"{0}"'.format(digest)
 
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename={0}'.format(filename)
+    if request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    filename = 'Meeting Transcription-{0}.pdf'.format(datetime.now())
+    byte_range = get_byte_range(request.META.get('HTTP_RANGE', ''), len(pdf))
+
+    if byte_range and byte_range[0] >= len(pdf):
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{0}'.format(len(pdf))
+        return response
+
+    response = HttpResponse(content_type='application/pdf')
+    response['Content-Disposition'] = 'attachment; filename={0}'.format(filename)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+
+    if byte_range:
+        start, end = byte_range
+        response.status_code = 206
+        response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(start, end, len(pdf))
+        response.write(pdf[start:end + 1])
+    else:
         response.write(pdf)
-    except Meeting.DoesNotExist:
-        response = Http404
 
     return response
 
@@ -62,7 +143,7 @@ def voice_initiate(request):
         tropo.ask(
             attempts=3,
             say='Please enter meeting ID',
-            choices='[4 DIGITS]',
+            choices=VOICE_ID_CHOICES,
             timeout=10
         )
 
@@ -80,102 +161,92 @@ def voice_validate(request):
     tropo = Tropo()
 
     if request.method == 'POST':
-        meetings = Meeting.objects.all()
+        body = request.body.decode('utf-8')
+        result = Result(body)
+        session_id = result.getSessionID()
+        entered_id = result.getValue()
 
-        if len(meetings) > 0:
-            body = request.body.decode('utf-8')
-            result = Result(body)
-            session_id = result.getSessionID()
-            entered_id = result.getValue()
-            voice_ids = [meeting.voice_id for meeting in meetings]
-
-            if entered_id in voice_ids:
-                try:
-                    meeting = Meeting.objects.get(voice_id=entered_id)
-                    meeting.caller_set.create(session_id=session_id)
-
-                    if meeting.voice_used == False:
-                        meeting.voice_used = True
-                        meeting.save()
-
-                    tropo.on(
-                        event='continue',
-                        next=get_full_url(reverse('home:voice_next', kwargs={'meeting_pk': meeting.pk}))
-                    )
-
-                    tropo.on(
-                        event='hangup',
-                        next=get_full_url(reverse('home:voice_hangup', kwargs={'meeting_pk': meeting.pk}))
-                    )
-
-                except Meeting.DoesNotExist:
-                    tropo.say('Invalid entry')
-            else:
-                tropo.say('Invalid entry')
-        else:
+        try:
+            meeting = Meeting.objects.get(voice_id=entered_id)
+            meeting.caller_set.create(session_id=session_id)
+
+            if meeting.voice_used == False:
+                meeting.voice_used = True
+                meeting.save(update_fields=['voice_used'])
+
+            tropo.on(
+                event='continue',
+                next=get_full_url(reverse('home:voice_next', kwargs={'meeting_pk': meeting.pk}))
+            )
+
+            tropo.on(
+                event='hangup',
+                next=get_full_url(reverse('home:voice_hangup', kwargs={'meeting_pk': meeting.pk}))
+            )
+
+        except Meeting.DoesNotExist:
             tropo.say('Invalid entry')
 
     json = tropo.RenderJson()
     return HttpResponse(json)
 
 
-@csrf_exempt
-def voice_next(request, meeting_pk):
+def render_voice_next(meeting, record):
     tropo = Tropo()
 
-    if request.method == 'POST':
-        try:
-            meeting = Meeting.objects.get(pk=meeting_pk)
+    if meeting.state == Meeting.STAGED:
+        tropo.say('Meeting has not started')
+    elif meeting.state == Meeting.IN_PROGRESS:
+        if record:
+            tropo.stopRecording()
 
-            if meeting.state == Meeting.STAGED:
-                tropo.say('Meeting has not started')
-            elif meeting.state == Meeting.IN_PROGRESS:
-                topic = Topic.objects.get(pk=meeting.current_topic.pk)
+            uri = get_full_url(reverse('home:voice_transcribe', kwargs={'topic_pk': meeting.topic_pk}))
 
-                if topic.recording == False:
-                    tropo.stopRecording()
+            tropo.startRecording(
+                url='http://hosting.tropo.com/5050915/www',
+                transcriptionOutURI=uri
+            )
 
-                    uri = get_full_url(reverse('home:voice_transcribe', kwargs={'topic_pk': topic.pk}))
+        tropo.say('Current topic: {0}'.format(meeting.topic_name))
 
-                    tropo.startRecording(
-                        url='http://hosting.tropo.com/5050915/www',
-                        transcriptionOutURI=uri
-                    )
+    tropo.conference(
+        id=meeting.voice_id,
+        terminator='*',
+        allowSignals=['next', 'exit']
+    )
 
-                    topic.recording = True
-                    topic.save()
+    next_url = get_full_url(reverse('home:voice_next', kwargs={'meeting_pk': meeting.pk}))
+    hangup_url = get_full_url(reverse('home:voice_hangup', kwargs={'meeting_pk': meeting.pk}))
 
-                tropo.say('Current topic: {0}'.format(topic.name))
+    tropo.on(event='continue', next=next_url)
+    tropo.on(event='next', next=next_url)
+    tropo.on(event='hangup', next=hangup_url)
+    tropo.on(event='exit', next=hangup_url)
 
-            tropo.conference(
-                id=meeting.voice_id,
-                terminator='*',
-                allowSignals=['next', 'exit']
-            )
+    return tropo.RenderJson()
 
-            tropo.on(
-                event='continue',
-                next=get_full_url(reverse('home:voice_next', kwargs={'meeting_pk': meeting.pk}))
-            )
 
-            tropo.on(
-                event='next',
-                next=get_full_url(reverse('home:voice_next', kwargs={'meeting_pk': meeting.pk}))
-            )
+@csrf_exempt
+def voice_next(request, meeting_pk):
+    meeting = live.get_meeting(meeting_pk) if request.method == 'POST' else None
 
-            tropo.on(
-                event='hangup',
-                next=get_full_url(reverse('home:voice_hangup', kwargs={'meeting_pk': meeting.pk}))
-            )
+    if meeting is None:
+        return HttpResponse(Tropo().RenderJson())
 
-            tropo.on(
-                event='exit',
-                next=get_full_url(reverse('home:voice_hangup', kwargs={'meeting_pk': meeting.pk}))
-            )
-        except Meeting.DoesNotExist:
-            pass
+    record = False
+
+    if meeting.state == Meeting.IN_PROGRESS:
+        # The Redis claim turns the herd away before Postgres, the conditional update confirms the winner
+        if live.claim_recording(meeting.pk, meeting.topic_pk) is not False:
+            record = Topic.objects.filter(pk=meeting.topic_pk, recording=False).update(recording=True) == 1
+
+    if record:
+        json = render_voice_next(meeting, record=True)
+    else:
+        # The key changes with every topic, so a new topic never sees a stale document
+        key = '{0}:{1}:{2}'.format(meeting.pk, meeting.state, meeting.topic_pk)
+        json = get_voice_response(key, lambda: render_voice_next(meeting, record=False))
 
-    json = tropo.RenderJson()
     return HttpResponse(json)
 
 
@@ -208,10 +279,11 @@ def voice_hangup(request, meeting_pk):
 def voice_transcribe(request, topic_pk):
     if request.method == 'POST':
         try:
-            body = request.body.decode('utf-8')
             topic = Topic.objects.get(pk=topic_pk)
-            topic.transcription = json.loads(body)['result']['transcription']
-            topic.save()
+            topic.transcription = codec.loads(request.body)['result']['transcription']
+            topic.save(update_fields=['transcription'])
+
+            prerender_transcript.delay(topic.pk)
         except Topic.DoesNotExist:
             pass
 
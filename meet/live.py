@@ -0,0 +1,214 @@
+import calendar
+from collections import namedtuple
+
+from django.apps import apps
+from django.conf import settings
+
+from spark.helpers import get_redis
+
+LIVE_KEY = 'meet:live:{0}'
+LIVE_ROOM_KEY = 'meet:live:room:{0}'
+
+# Returns -1 when the meeting is not loaded, 0 when another transition won and 1 on success
+TRANSITION_SCRIPT = '''
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+local current = redis.call('HMGET', KEYS[1], 'state', 'topic')
+if current[1] ~= ARGV[1] or current[2] ~= ARGV[2] then
+    return 0
+end
+redis.call('HMSET', KEYS[1], 'state', ARGV[3], 'topic', ARGV[4], 'topic_name', ARGV[5], 'deadline', '')
+redis.call('EXPIRE', KEYS[1], ARGV[6])
+return 1
+'''
+
+# Only the topic the deadline belongs to may set it, a topic advanced meanwhile keeps its own
+SET_DEADLINE_SCRIPT = '''
+if redis.call('HGET', KEYS[1], 'topic') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'deadline', ARGV[2])
+return 1
+'''
+
+# Returns 0 when the meeting is not loaded, so a partial hash is never created
+SET_STATE_SCRIPT = '''
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'state', ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+'''
+
+# Returns -1 when the meeting is not loaded, otherwise 1 for the one caller that claims the topic recording
+CLAIM_RECORDING_SCRIPT = '''
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+return redis.call('HSETNX', KEYS[1], ARGV[1], 1)
+'''
+
+LiveMeeting = namedtuple('LiveMeeting', ['pk', 'room_id', 'voice_id', 'state', 'topic_pk', 'topic_name', 'deadline'])
+
+_transition = None
+_set_state = None
+_set_deadline = None
+_claim_recording = None
+
+
+def get_deadline(topic):
+    if topic is None or topic.deadline is None:
+        return None
+
+    return calendar.timegm(topic.deadline.utctimetuple())
+
+
+def publish(meeting):
+    topic = meeting.current_topic
+    deadline = get_deadline(topic)
+
+    state = {
+        'room_id': meeting.room_id,
+        'voice_id': meeting.voice_id,
+        'state': meeting.state,
+        'topic': topic.pk if topic else '',
+        'topic_name': topic.name if topic else '',
+        'deadline': deadline if deadline is not None else ''
+    }
+
+    pipe = get_redis().pipeline()
+    pipe.hmset(LIVE_KEY.format(meeting.pk), state)
+    pipe.expire(LIVE_KEY.format(meeting.pk), settings.LIVE_STATE_TTL)
+    pipe.setex(LIVE_ROOM_KEY.format(meeting.room_id), settings.LIVE_STATE_TTL, meeting.pk)
+    pipe.execute()
+
+
+def set_state(meeting_pk, state):
+    global _set_state
+
+    if _set_state is None:
+        _set_state = get_redis().register_script(SET_STATE_SCRIPT)
+
+    keys = [LIVE_KEY.format(meeting_pk)]
+    args = [state, settings.LIVE_STATE_TTL]
+
+    if not _set_state(keys=keys, args=args) and load(meeting_pk) is not None:
+        _set_state(keys=keys, args=args)
+
+
+def set_deadline(meeting_pk, topic_pk, deadline):
+    global _set_deadline
+
+    if _set_deadline is None:
+        _set_deadline = get_redis().register_script(SET_DEADLINE_SCRIPT)
+
+    _set_deadline(keys=[LIVE_KEY.format(meeting_pk)], args=[topic_pk, deadline])
+
+
+def claim_recording(meeting_pk, topic_pk):
+    global _claim_recording
+
+    if _claim_recording is None:
+        _claim_recording = get_redis().register_script(CLAIM_RECORDING_SCRIPT)
+
+    result = _claim_recording(keys=[LIVE_KEY.format(meeting_pk)], args=['recording:{0}'.format(topic_pk)])
+
+    if result == -1:
+        return None
+
+    return result == 1
+
+
+def clear(meeting):
+    pipe = get_redis().pipeline()
+    pipe.delete(LIVE_KEY.format(meeting.pk))
+    pipe.delete(LIVE_ROOM_KEY.format(meeting.room_id))
+    pipe.execute()
+
+
+def load(meeting_pk):
+    Meeting = apps.get_model('meet', 'Meeting')
+
+    try:
+        meeting = Meeting.objects.select_related('current_topic').get(pk=meeting_pk)
+    except Meeting.DoesNotExist:
+        return None
+
+    publish(meeting)
+    return meeting
+
+
+def get_meeting(meeting_pk):
+    state = get_redis().hgetall(LIVE_KEY.format(meeting_pk))
+
+    if not state:
+        meeting = load(meeting_pk)
+
+        if meeting is None:
+            return None
+
+        return LiveMeeting(
+            meeting.pk,
+            meeting.room_id,
+            meeting.voice_id,
+            meeting.state,
+            meeting.current_topic_id,
+            meeting.current_topic.name if meeting.current_topic else '',
+            get_deadline(meeting.current_topic)
+        )
+
+    return LiveMeeting(
+        int(meeting_pk),
+        state['room_id'],
+        state['voice_id'],
+        int(state['state']),
+        int(state['topic']) if state['topic'] else None,
+        state['topic_name'],
+        float(state['deadline']) if state.get('deadline') else None
+    )
+
+
+def get_room_meeting(room_id):
+    meeting_pk = get_redis().get(LIVE_ROOM_KEY.format(room_id))
+
+    if meeting_pk is None:
+        Meeting = apps.get_model('meet', 'Meeting')
+        meeting_pk = Meeting.objects.filter(room_id=room_id).values_list('pk', flat=True).first()
+
+        if meeting_pk is None:
+            return None
+
+    return get_meeting(meeting_pk)
+
+
+def transition(meeting_pk, from_state, from_topic_pk, to_state, to_topic_pk, to_topic_name=''):
+    global _transition
+
+    if _transition is None:
+        _transition = get_redis().register_script(TRANSITION_SCRIPT)
+
+    keys = [LIVE_KEY.format(meeting_pk)]
+
+    args = [
+        from_state,
+        from_topic_pk or '',
+        to_state,
+        to_topic_pk or '',
+        to_topic_name,
+        settings.LIVE_STATE_TTL
+    ]
+
+    result = _transition(keys=keys, args=args)
+
+    if result == -1 and load(meeting_pk) is not None:
+        result = _transition(keys=keys, args=args)
+
+    if result != 1:
+        return False
+
+    # Postgres only sees the transition, never the in-between state
+    Meeting = apps.get_model('meet', 'Meeting')
+    Meeting.objects.filter(pk=meeting_pk).update(state=to_state, current_topic=to_topic_pk)
+    return True
@@ -0,0 +1,118 @@
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from spark.helpers import get_redis
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY = 'meet:metrics'
+SAMPLES_KEY = 'meet:metrics:samples:{0}'
+SAMPLED_KEY = 'meet:metrics:sampled'
+
+PERCENTILES = (50, 99)
+
+_counts = Counter()
+_counts_lock = threading.Lock()
+_flushed_at = time.time()
+
+
+def incr(name, amount=1):
+    try:
+        get_redis().hincrby(METRICS_KEY, name, amount)
+    except RedisError:
+        logger.exception('Unable to record metric %s', name)
+
+
+def count(name, amount=1):
+    # Hot-path counters stay in the process and reach Redis in one pipeline per flush interval
+    with _counts_lock:
+        _counts[name] += amount
+        due = time.time() - _flushed_at >= settings.METRICS_FLUSH_INTERVAL
+
+    if due:
+        flush()
+
+
+def flush():
+    global _flushed_at
+
+    with _counts_lock:
+        counts = dict(_counts)
+        _counts.clear()
+        _flushed_at = time.time()
+
+    if not counts:
+        return None
+
+    try:
+        pipe = get_redis().pipeline()
+
+        for name, amount in counts.items():
+            pipe.hincrby(METRICS_KEY, name, amount)
+
+        pipe.execute()
+    except RedisError:
+        logger.exception('Unable to flush %d buffered metrics', len(counts))
+
+
+def timing(name, seconds):
+    try:
+        pipe = get_redis().pipeline()
+        pipe.hincrby(METRICS_KEY, '{0}.count'.format(name), 1)
+        pipe.hincrbyfloat(METRICS_KEY, '{0}.total'.format(name), seconds)
+        pipe.hset(METRICS_KEY, '{0}.last'.format(name), seconds)
+        pipe.execute()
+    except RedisError:
+        logger.exception('Unable to record metric %s', name)
+
+
+def observe(name, value):
+    # Only keeps a sliding window of samples, publish_percentiles summarizes it off the hot path
+    samples_key = SAMPLES_KEY.format(name)
+
+    try:
+        pipe = get_redis().pipeline()
+        pipe.lpush(samples_key, value)
+        pipe.ltrim(samples_key, 0, settings.METRICS_SAMPLE_SIZE - 1)
+        pipe.sadd(SAMPLED_KEY, name)
+        pipe.execute()
+    except RedisError:
+        logger.exception('Unable to record metric %s', name)
+
+
+def publish_percentiles():
+    try:
+        redis = get_redis()
+
+        for name in redis.smembers(SAMPLED_KEY):
+            samples = sorted(float(sample) for sample in redis.lrange(SAMPLES_KEY.format(name), 0, -1))
+
+            if not samples:
+                continue
+
+            pipe = redis.pipeline()
+
+            for percentile in PERCENTILES:
+                index = min(int(len(samples) * percentile / 100.0), len(samples) - 1)
+                pipe.hset(METRICS_KEY, '{0}.p{1}'.format(name, percentile), samples[index])
+
+            pipe.execute()
+    except RedisError:
+        logger.exception('Unable to publish metric percentiles')
+
+
+def record_queue_depth(queue):
+    try:
+        redis = get_redis()
+        redis.hset(METRICS_KEY, 'queues.{0}.depth'.format(queue), redis.llen(queue))
+    except RedisError:
+        logger.exception('Unable to record the depth of queue %s', queue)
+
+
+def get_metrics():
+    return get_redis().hgetall(METRICS_KEY)
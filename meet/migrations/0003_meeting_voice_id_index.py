@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 12:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import meet.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meet', '0002_meeting_spark_audio'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='meeting',
+            name='state',
+            field=models.IntegerField(choices=[(0, 'Staged'), (1, 'In Progress'), (2, 'Completed'), (3, 'Canceled')], default=0),
+        ),
+        migrations.AlterField(
+            model_name='meeting',
+            name='voice_id',
+            field=models.CharField(db_index=True, default=meet.models.get_voice_id, max_length=200),
+        ),
+    ]
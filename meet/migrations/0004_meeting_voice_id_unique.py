@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 12:30
+from __future__ import unicode_literals
+
+import random
+
+from django.db import migrations, models
+import meet.models
+
+
+def reassign_duplicate_voice_ids(apps, schema_editor):
+    Meeting = apps.get_model('meet', 'Meeting')
+    in_use = set()
+    duplicates = []
+
+    # The oldest meeting keeps a shared PIN, every later one gets a free PIN
+    for pk, voice_id in Meeting.objects.order_by('pk').values_list('pk', 'voice_id'):
+        if voice_id in in_use:
+            duplicates.append(pk)
+        else:
+            in_use.add(voice_id)
+
+    for pk in duplicates:
+        free = [str(pin) for pin in range(1000, 10000) if str(pin) not in in_use]
+
+        if free:
+            voice_id = random.choice(free)
+        else:
+            voice_id = str(random.randint(10000, 99999))
+
+            while voice_id in in_use:
+                voice_id = str(random.randint(10000, 99999))
+
+        Meeting.objects.filter(pk=pk).update(voice_id=voice_id)
+        in_use.add(voice_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meet', '0003_meeting_voice_id_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(reassign_duplicate_voice_ids, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='meeting',
+            name='voice_id',
+            field=models.CharField(default=meet.models.get_voice_id, max_length=200, unique=True),
+        ),
+    ]
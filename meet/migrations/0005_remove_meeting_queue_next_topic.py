@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 13:00
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meet', '0004_meeting_voice_id_unique'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='meeting',
+            name='queue_next_topic',
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 13:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meet', '0005_remove_meeting_queue_next_topic'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='topic',
+            name='deadline',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 15:00
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meet', '0006_topic_deadline'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='meeting',
+            name='voice_id',
+            field=models.CharField(max_length=200, unique=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.2 on 2026-10-18 15:30
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meet', '0007_meeting_voice_id_no_default'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='topic',
+            name='time_left',
+        ),
+    ]
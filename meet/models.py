@@ -1,12 +1,19 @@
 from datetime import timedelta
 from random import randint
+from xml.sax.saxutils import escape
 from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.enums import TA_CENTER
 
+from . import live
+from .pins import allocate_pin, release_pin
 
+
+# Only referenced by the historical migrations, meetings get their PIN from allocate_pin
 def get_voice_id():
     return str(randint(1000, 9999))
 
@@ -26,14 +33,13 @@ class Meeting(models.Model):
 
     room_name = models.CharField(max_length=200, default='none')
     room_id = models.CharField(max_length=200, default='none')
-    voice_id = models.CharField(max_length=200, default=get_voice_id)
+    voice_id = models.CharField(max_length=200, unique=True)
     voice_used = models.BooleanField(default=False)
     spark_audio = models.BooleanField(default=False)
     state = models.IntegerField(choices=MEETING_STATES, default=STAGED)
     length = models.IntegerField(default=0)
     topic_time_limit = models.IntegerField(default=0)
     current_topic = models.OneToOneField('Topic', on_delete=models.SET_NULL, related_name='+', null=True)
-    queue_next_topic = models.BooleanField(default=False)
     complete_id = models.CharField(max_length=200, default='none')
 
     @classmethod
@@ -43,6 +49,7 @@ class Meeting(models.Model):
         meeting = cls(
             room_name=room['title'],
             room_id=room['id'],
+            voice_id=allocate_pin(),
             length=meeting_length,
             topic_time_limit=topic_time_limit,
             spark_audio=spark_audio
@@ -54,10 +61,18 @@ class Meeting(models.Model):
         return self.room_name
 
 
+# A signal rather than Meeting.delete, so queryset and admin bulk deletes release the PIN
+# and the live state too
+@receiver(post_delete, sender=Meeting)
+def release_meeting(sender, instance, **kwargs):
+    release_pin(instance.voice_id)
+    live.clear(instance)
+
+
 class Topic(models.Model):
     name = models.CharField(max_length=200, default='none')
     message_id = models.CharField(max_length=200, default='none')
-    time_left = models.IntegerField(default=0)
+    deadline = models.DateTimeField(blank=True, null=True)
     recording = models.BooleanField(default=False)
     transcription = models.TextField(blank=True, null=True)
     meeting = models.ForeignKey(Meeting, on_delete=models.CASCADE)
@@ -77,10 +92,34 @@ class Caller(models.Model):
 
 # PDF Transcription
 
+_styles = None
+
+
+def get_styles():
+    global _styles
+
+    if _styles is None:
+        _styles = getSampleStyleSheet()
+        _styles.add(ParagraphStyle(name='centered', alignment=TA_CENTER))
+
+    return _styles
+
+
+def get_section_markup(topic):
+    transcription = topic.transcription or 'Unable to collect transcription'
+    return [['Heading1', escape(topic.name)], ['Normal', escape(transcription)]]
+
+
+def build_section(markup):
+    styles = get_styles()
+    return [Paragraph(text, styles[style]) for style, text in markup]
+
+
 class MeetingTranscription(object):
-    def __init__(self, meeting, buffer):
+    def __init__(self, meeting, buffer, sections=None):
         self.meeting = meeting
         self.buffer = buffer
+        self.sections = sections
         self.pagesize = letter
         self.width, self.height = self.pagesize
 
@@ -98,16 +137,12 @@ class MeetingTranscription(object):
 
         elements = []
 
-        styles = getSampleStyleSheet()
-        styles.add(ParagraphStyle(name='centered', alignment=TA_CENTER))
-
-        for topic in self.meeting.topic_set.all().order_by('pk'):
-            elements.append(Paragraph(topic.name, styles['Heading1']))
+        if self.sections is None:
+            topics = self.meeting.topic_set.all().order_by('pk')
+            self.sections = [build_section(get_section_markup(topic)) for topic in topics]
 
-            if topic.transcription:
-                elements.append(Paragraph(topic.transcription, styles['Normal']))
-            else:
-                elements.append(Paragraph('Unable to collect transcription', styles['Normal']))
+        for section in self.sections:
+            elements.extend(section)
 
         doc.build(elements)
         pdf = buffer.getvalue()
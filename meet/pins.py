@@ -0,0 +1,86 @@
+import logging
+import random
+
+from django.apps import apps
+from django.conf import settings
+from redis.exceptions import LockError
+
+from spark.helpers import get_redis
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+FREE_PINS_KEY = 'meet:pins:free'
+SEED_LOCK_KEY = 'meet:pins:seed'
+SEED_LOCK_TIMEOUT = 30
+
+PIN_RANGE = range(1000, 10000)
+
+
+def seed_pins(redis):
+    # Allocators that find the pool missing wait here while the first one rebuilds it
+    try:
+        with redis.lock(SEED_LOCK_KEY, timeout=SEED_LOCK_TIMEOUT, blocking_timeout=SEED_LOCK_TIMEOUT):
+            if redis.exists(FREE_PINS_KEY):
+                return False
+
+            Meeting = apps.get_model('meet', 'Meeting')
+            in_use = set(Meeting.objects.values_list('voice_id', flat=True))
+
+            pins = [str(pin) for pin in PIN_RANGE if str(pin) not in in_use]
+            random.shuffle(pins)
+
+            if pins:
+                redis.rpush(FREE_PINS_KEY, *pins)
+    except LockError:
+        logger.exception('Unable to seed the voice PIN pool')
+        return False
+
+    return True
+
+
+def get_fallback_pin():
+    Meeting = apps.get_model('meet', 'Meeting')
+    digits = settings.VOICE_ID_FALLBACK_DIGITS
+
+    while True:
+        pin = str(random.randint(10 ** (digits - 1), 10 ** digits - 1))
+
+        if not Meeting.objects.filter(voice_id=pin).exists():
+            return pin
+
+
+def allocate_pin():
+    Meeting = apps.get_model('meet', 'Meeting')
+    redis = get_redis()
+
+    while True:
+        pin = redis.lpop(FREE_PINS_KEY)
+
+        if pin is None:
+            seed_pins(redis)
+            pin = redis.lpop(FREE_PINS_KEY)
+
+        if pin is None:
+            break
+
+        # The pool can drift from the table, e.g. a PIN released twice, so one still in use is dropped
+        if not Meeting.objects.filter(voice_id=pin).exists():
+            metrics.incr('pins.allocated')
+            return pin
+
+        metrics.incr('pins.stale')
+
+    metrics.incr('pins.exhausted')
+    logger.warning('Voice PIN pool is exhausted')
+
+    if not settings.VOICE_ID_FALLBACK:
+        raise ValueError('No meeting IDs are available, please try again later')
+
+    return get_fallback_pin()
+
+
+def release_pin(pin):
+    if pin.isdigit() and int(pin) in PIN_RANGE:
+        get_redis().rpush(FREE_PINS_KEY, pin)
+        metrics.incr('pins.released')
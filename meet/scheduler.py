@@ -0,0 +1,58 @@
+import time
+from collections import namedtuple
+
+from spark.helpers import get_redis
+
+TIMERS_KEY = 'meet:timers'
+MEETING_TIMERS_KEY = 'meet:timers:{0}'
+
+Timer = namedtuple('Timer', ['meeting_pk', 'topic_pk', 'action', 'due'])
+
+
+def _member(meeting_pk, topic_pk, action):
+    return '{0}:{1}:{2}'.format(meeting_pk, topic_pk or 0, action)
+
+
+def _parse(member, due):
+    meeting_pk, topic_pk, action = member.split(':', 2)
+    return Timer(int(meeting_pk), int(topic_pk) or None, action, due)
+
+
+def schedule(meeting_pk, topic_pk, action, due):
+    member = _member(meeting_pk, topic_pk, action)
+
+    pipe = get_redis().pipeline()
+    pipe.zadd(TIMERS_KEY, due, member)
+    pipe.sadd(MEETING_TIMERS_KEY.format(meeting_pk), member)
+    pipe.execute()
+
+
+def cancel(meeting_pk):
+    redis = get_redis()
+    meeting_key = MEETING_TIMERS_KEY.format(meeting_pk)
+    members = redis.smembers(meeting_key)
+
+    pipe = redis.pipeline()
+
+    if members:
+        pipe.zrem(TIMERS_KEY, *members)
+
+    pipe.delete(meeting_key)
+    pipe.execute()
+
+
+def pop_due(now=None):
+    if now is None:
+        now = time.time()
+
+    redis = get_redis()
+    timers = []
+
+    for member, due in redis.zrangebyscore(TIMERS_KEY, '-inf', now, withscores=True):
+        # Only the worker whose ZREM succeeds owns the timer
+        if redis.zrem(TIMERS_KEY, member):
+            timer = _parse(member, due)
+            redis.srem(MEETING_TIMERS_KEY.format(timer.meeting_pk), member)
+            timers.append(timer)
+
+    return timers
@@ -1,29 +1,60 @@
 from __future__ import absolute_import
 
+import logging
 import os
-import re
 import time
 from datetime import datetime
 from datetime import timedelta
+from itertools import islice
 
 from celery import shared_task
+from django.conf import settings
 from django.core.urlresolvers import reverse
+from django.utils import timezone
+from redis.exceptions import LockError
 
-from spark.helpers import get_full_url
+from spark.helpers import get_full_url, get_redis
+from . import client, commands, live, metrics, scheduler
+from .cache import get_bot_person_id, get_room, invalidate_room
+from .commands import parse_command
 from .models import Meeting, Topic
+from .transcripts import prerender_pdf, render_pdf
 from .calls import (
     get_message_details,
     send_message,
     get_rooms,
-    get_room_details,
     get_room_memberships,
     delete_room,
     get_webhooks,
     create_webhook,
-    send_signal,
+    send_signals,
     create_session
 )
 
+logger = logging.getLogger(__name__)
+
+UPDATE_BOT_LOCK = 'meet:update_bot:lock'
+ROOM_CURSORS_KEY = 'meet:update_bot:rooms'
+TRANSCRIPT_CLAIM_KEY = 'meet:transcript:{0}'
+
+WORK_QUEUES = (
+    settings.CELERY_QUEUES_TIMERS,
+    settings.CELERY_QUEUES_INTERACTIVE,
+    settings.CELERY_QUEUES_RECONCILE,
+    settings.CELERY_QUEUES_DOCUMENTS,
+)
+
+MEETING_START = 'start'
+TOPIC_END = 'end'
+TRANSCRIPTION_TIMEOUT = 'transcription'
+
+# (minimum topic time limit, seconds left, message)
+TOPIC_WARNINGS = (
+    (240, 120, '2 minute warning!'),
+    (120, 60, '1 minute warning!'),
+    (60, 15, '15 second warning!'),
+)
+
 
 def send_welcome_message(room_id):
     welcome_message = []
@@ -39,76 +70,157 @@ def send_welcome_message(room_id):
 
 @shared_task()
 def update_bot():
-    for room in get_rooms():
+    lock = get_redis().lock(UPDATE_BOT_LOCK, timeout=settings.UPDATE_BOT_LOCK_TIMEOUT)
+
+    # A run that overlaps one still in progress is skipped rather than queued
+    if not lock.acquire(blocking=False):
+        metrics.incr('update_bot.skipped')
+        return None
+
+    try:
+        reconcile_rooms(lock)
+    except LockError:
+        # The lock expired mid-sweep, so stop before overlapping with the next run
+        logger.warning('update_bot lost its lock, stopping the sweep')
+        metrics.incr('update_bot.lock_lost')
+    finally:
         try:
-            room_memberships = get_room_memberships(room['id'])
+            lock.release()
+        except LockError:
+            logger.warning('update_bot lock had already expired on release')
+            metrics.incr('update_bot.lock_expired')
+
+
+def reconcile_rooms(lock):
+    webhook_filters = set(webhook.get('filter') for webhook in get_webhooks())
+    rooms = get_rooms()
+
+    # Rooms are handled in bounded batches, so memory stays flat however many rooms the bot is in
+    while True:
+        started = time.time()
+        batch = list(islice(rooms, settings.UPDATE_BOT_BATCH_SIZE))
+
+        if not batch:
+            break
+
+        reconcile_batch(batch, webhook_filters)
 
-            if len(room_memberships) == 1:
-                delete_room(room['id'])
+        # Giving back the time the batch took keeps the lock alive for as long as the sweep runs
+        lock.extend(time.time() - started)
 
-            if len(room_memberships) > 2:
-                filter = 'roomId={0}'.format(room['id'])
-                filter_list = [webhook['filter'] for webhook in get_webhooks()]
-                room = get_room_details(room['id'])
 
-                if filter not in filter_list:
+def reconcile_batch(rooms, webhook_filters):
+    redis = get_redis()
+    now = time.time()
+    cursors = redis.hmget(ROOM_CURSORS_KEY, [room['id'] for room in rooms])
+    active_rooms = []
+
+    for room, cursor in zip(rooms, cursors):
+        cursor = (cursor or '').split('|')
+
+        # Rooms with no new activity are skipped until the next full sweep
+        if cursor[0] != room.get('lastActivity') or now - float(cursor[-1] or 0) > settings.UPDATE_BOT_SWEEP_INTERVAL:
+            active_rooms.append(room)
+
+    # Only one, two or more than two members matter, so stop after the third
+    memberships = client.fan_out(
+        lambda room_id: list(islice(get_room_memberships(room_id, page_size=3), 3)),
+        [room['id'] for room in active_rooms],
+        max_workers=settings.UPDATE_BOT_WORKERS
+    )
+
+    for room_id, error in memberships.failures.items():
+        logger.warning('Unable to fetch the memberships of room %s: %r', room_id, error)
+
+    if memberships.failures:
+        metrics.incr('update_bot.membership_failures', len(memberships.failures))
+
+    for room in active_rooms:
+        # Rooms whose memberships could not be fetched keep their cursor and are retried next run
+        if room['id'] not in memberships.results:
+            continue
+
+        room_memberships = memberships.results[room['id']]
+
+        if len(room_memberships) == 1:
+            delete_room(room['id'])
+            invalidate_room(room['id'])
+            redis.hdel(ROOM_CURSORS_KEY, room['id'])
+            continue
+
+        if len(room_memberships) > 2:
+            filter = 'roomId={0}'.format(room['id'])
+
+            if filter not in webhook_filters:
+                try:
+                    room_details = get_room(room['id'])
+
                     create_webhook(
-                        name='{0} Webhook'.format(room['title']),
+                        name='{0} Webhook'.format(room_details['title']),
                         room_id=room['id']
                     )
+                except KeyError:
+                    logger.warning('Unable to create a webhook for room %s', room['id'])
+                    metrics.incr('update_bot.webhook_failures')
+                    continue
 
-                    send_welcome_message(room_id=room['id'])
-        except KeyError:
-            None
+                send_welcome_message(room_id=room['id'])
+                webhook_filters.add(filter)
+
+        redis.hset(ROOM_CURSORS_KEY, room['id'], '{0}|{1}'.format(room.get('lastActivity'), now))
+
+
+@shared_task(acks_late=True)
+def process_webhook(resource, event, data):
+    route_request(resource=resource, event=event, data=data)
 
 
 def route_request(resource, event, data):
     if resource == 'messages' and event == 'created':
+        if data.get('personId') and data['personId'] == get_bot_person_id():
+            metrics.incr('webhooks.bot_messages_skipped')
+            return None
+
         message = get_message_details(data['id'])
+        command = parse_command(message.get('text'))
 
-        help_match = re.match(pattern=r'(?i)^/+MEET\?$', string=message['text'])
+        if command is None:
+            return None
 
-        if help_match:
+        if command.name == commands.HELP:
             send_welcome_message(room_id=message['roomId'])
             return None
 
-        try:
-            meeting = Meeting.objects.get(room_id=message['roomId'])
+        meeting = live.get_room_meeting(message['roomId'])
 
-            start_match = re.match(pattern=r'(?i)^/+START$', string=message['text'])
+        if meeting is None:
+            if command.name == commands.MEET:
+                try:
+                    initiate_meeting(parameters=command.parameters, room_id=message['roomId'])
+                except ValueError as error:
+                    send_message(text=error.args[0], room_id=message['roomId'])
 
-            if start_match and meeting.state == Meeting.STAGED:
-                start_meeting.delay(meeting)
+            return None
 
-            status_match = re.match(pattern=r'(?i)^/+STATUS$', string=message['text'])
+        try:
+            if command.name == commands.START and meeting.state == Meeting.STAGED:
+                start_meeting.delay(meeting.pk)
 
-            if status_match and meeting.state == Meeting.IN_PROGRESS:
+            if command.name == commands.STATUS and meeting.state == Meeting.IN_PROGRESS:
                 get_meeting_status(meeting)
 
-            next_match = re.match(pattern=r'(?i)^/+NEXT$', string=message['text'])
-
-            if next_match and meeting.state == Meeting.IN_PROGRESS:
-                meeting.queue_next_topic = True
-                meeting.save()
-
-            cancel_match = re.match(pattern=r'(?i)^/+CANCEL$', string=message['text'])
-
-            if cancel_match:
-                cancel_meeting(meeting)
+            if command.name == commands.NEXT and meeting.state == Meeting.IN_PROGRESS:
+                advance_topic.delay(meeting.pk, meeting.topic_pk)
 
+            if command.name == commands.CANCEL:
+                cancel_meeting(Meeting.objects.get(pk=meeting.pk))
 
         except Meeting.DoesNotExist:
-            meet_match = re.match(pattern=r'(?i)^/+MEET(?P<parameters>.*)', string=message['text'])
-
-            if meet_match:
-                try:
-                    initiate_meeting(parameters=meet_match.group('parameters'), room_id=message['roomId'])
-                except ValueError as error:
-                    send_message(text=error.args[0], room_id=message['roomId'])
+            pass
 
 
 def initiate_meeting(parameters, room_id):
-    parameters_match = re.match(pattern=r'(?i)^(?P<sip>|\$)(?P<time>|\!|[0-9]+)\s(?P<topics>.*)', string=parameters)
+    parameters_match = commands.MEET_PARAMETERS_PATTERN.match(parameters)
 
     if not parameters_match:
         raise ValueError('Invalid parameters')
@@ -116,21 +228,16 @@ def initiate_meeting(parameters, room_id):
     meeting_length = 10
     spark_audio = False
 
-    dollar_sign_pattern = r'^\$$'
-
-    if re.match(dollar_sign_pattern, parameters_match.group('sip')):
+    if parameters_match.group('sip') == '$':
         spark_audio = True
 
-    digit_pattern = r'^\d+$'
-    exclamation_pattern = r'^\!$'
-
-    if re.match(digit_pattern, parameters_match.group('time')):
+    if parameters_match.group('time').isdigit():
         meeting_length = int(parameters_match.group('time'))
 
         if meeting_length < 1 or meeting_length > 30:
             raise ValueError('Meeting length is out of range')
 
-    elif re.match(exclamation_pattern, parameters_match.group('time')):
+    elif parameters_match.group('time') == '!':
         current_minute = datetime.now().minute
 
         if current_minute < 30:
@@ -155,7 +262,7 @@ def initiate_meeting(parameters, room_id):
 
     if len(topics) > 0:
         meeting = Meeting.create(
-            room=get_room_details(room_id),
+            room=get_room(room_id),
             meeting_length=meeting_length,
             topic_count=len(topics),
             spark_audio=spark_audio
@@ -166,7 +273,8 @@ def initiate_meeting(parameters, room_id):
         for topic in topics:
             meeting.topic_set.create(name=topic)
 
-        stage_meeting.delay(meeting)
+        live.publish(meeting)
+        stage_meeting.delay(meeting.pk)
 
         return None
 
@@ -174,7 +282,12 @@ def initiate_meeting(parameters, room_id):
 
 
 @shared_task()
-def stage_meeting(meeting):
+def stage_meeting(meeting_pk):
+    try:
+        meeting = Meeting.objects.get(pk=meeting_pk)
+    except Meeting.DoesNotExist:
+        return None
+
     initial_message = []
     initial_message.append('A meeting for the following topics has been initiated...')
 
@@ -211,73 +324,152 @@ def stage_meeting(meeting):
     send_message(text='\n'.join(initial_message), room_id=meeting.room_id)
 
     if meeting.spark_audio == True:
-        room = get_room_details(meeting.room_id)
+        room = get_room(meeting.room_id)
         message = 'Meeting has been initiated'
         create_session(sip_address=room['sipAddress'], message=message)
 
-    time.sleep(60)
+    scheduler.schedule(meeting.pk, None, MEETING_START, time.time() + 60)
 
-    try:
-        meeting.refresh_from_db()
 
-        if meeting.state == Meeting.STAGED:
-            start_meeting.delay(meeting)
-    except Meeting.DoesNotExist:
-        pass
+@shared_task()
+def start_meeting(meeting_pk, due=None):
+    if due is not None:
+        metrics.observe('timers.lateness', time.time() - due)
+
+    first_topic = Topic.objects.filter(meeting=meeting_pk).order_by('pk').first()
+
+    if first_topic is None:
+        return None
+
+    if live.transition(meeting_pk, Meeting.STAGED, None, Meeting.IN_PROGRESS, first_topic.pk, first_topic.name):
+        scheduler.cancel(meeting_pk)
+
+        try:
+            begin_topic(Meeting.objects.get(pk=meeting_pk), first_topic)
+        except Meeting.DoesNotExist:
+            pass
+
+
+def begin_topic(meeting, topic, started_at=None):
+    # Chaining each deadline off the previous one keeps late timers from stretching the meeting
+    if started_at is None or started_at + meeting.topic_time_limit <= time.time():
+        started_at = time.time()
+
+    deadline = started_at + meeting.topic_time_limit
+
+    # The timers and deadline go first, so a failed Spark or Tropo call can never strand the meeting
+    for minimum_time_limit, seconds_left, text in TOPIC_WARNINGS:
+        if meeting.topic_time_limit >= minimum_time_limit:
+            scheduler.schedule(meeting.pk, topic.pk, str(seconds_left), deadline - seconds_left)
+
+    scheduler.schedule(meeting.pk, topic.pk, TOPIC_END, deadline)
+
+    Topic.objects.filter(pk=topic.pk).update(deadline=datetime.fromtimestamp(deadline, timezone.utc))
+    live.set_deadline(meeting.pk, topic.pk, deadline)
+
+    start_text = []
+    start_text.append('########################')
+    start_text.append('Topic: {0}'.format(topic.name))
+    start_text.append('########################')
+
+    start_message = send_message(text='\n'.join(start_text), room_id=meeting.room_id)
+
+    if 'id' in start_message:
+        Topic.objects.filter(pk=topic.pk).update(message_id=start_message['id'])
+
+    if meeting.spark_audio == True:
+        room = get_room(meeting.room_id)
+        message = 'Current topic: {0}'.format(topic.name)
+        create_session(sip_address=room['sipAddress'], message=message)
+
+    send_signals(meeting.caller_set.values_list('session_id', flat=True), signal='next')
 
 
 @shared_task()
-def start_meeting(meeting):
-    try:
-        meeting.state = Meeting.IN_PROGRESS
-        meeting.save()
+def dispatch_timers():
+    for timer in scheduler.pop_due():
+        fire_timer.delay(timer.meeting_pk, timer.topic_pk, timer.action, timer.due)
 
-        for topic in meeting.topic_set.all().order_by('pk'):
-            start_text = []
-            start_text.append('########################')
-            start_text.append('Topic: {0}'.format(topic.name))
-            start_text.append('########################')
 
-            start_message = send_message(text='\n'.join(start_text), room_id=meeting.room_id)
+@shared_task()
+def probe_queues():
+    for queue in WORK_QUEUES:
+        metrics.record_queue_depth(queue)
+        measure_queue_latency.apply_async(args=[queue, time.time()], queue=queue)
 
-            topic.message_id = start_message['id']
-            topic.time_left = meeting.topic_time_limit
-            topic.save()
+    metrics.flush()
+    metrics.publish_percentiles()
 
-            meeting.current_topic = topic
-            meeting.save()
 
-            if meeting.spark_audio == True:
-                room = get_room_details(meeting.room_id)
-                message = 'Current topic: {0}'.format(topic.name)
-                create_session(sip_address=room['sipAddress'], message=message)
+@shared_task()
+def measure_queue_latency(queue, sent):
+    metrics.observe('queues.{0}.latency'.format(queue), time.time() - sent)
 
-            for caller in meeting.caller_set.all():
-                send_signal(session_id=caller.session_id, signal='next')
 
-            while topic.time_left != 0:
-                if meeting.topic_time_limit >= 240 and topic.time_left == 120:
-                    send_message(text='2 minute warning!', room_id=meeting.room_id)
+@shared_task()
+def fire_timer(meeting_pk, topic_pk, action, due):
+    metrics.observe('timers.dispatch_lateness', time.time() - due)
 
-                if meeting.topic_time_limit >= 120 and topic.time_left == 60:
-                    send_message(text='1 minute warning!', room_id=meeting.room_id)
+    # Timer workers only dispatch, the work itself runs on its own queue and records the full lateness
+    if action == MEETING_START:
+        start_meeting.delay(meeting_pk, due=due)
+        return None
+
+    if action == TOPIC_END:
+        advance_topic.delay(meeting_pk, topic_pk, started_at=due)
+        return None
+
+    if action == TRANSCRIPTION_TIMEOUT:
+        render_transcript.delay(meeting_pk, 'timeout', due=due)
+        return None
+
+    send_topic_warning.delay(meeting_pk, topic_pk, action, due)
+
+
+@shared_task()
+def send_topic_warning(meeting_pk, topic_pk, action, due):
+    metrics.observe('timers.lateness', time.time() - due)
+
+    meeting = live.get_meeting(meeting_pk)
+
+    if meeting is None or meeting.state != Meeting.IN_PROGRESS or meeting.topic_pk != topic_pk:
+        return None
 
-                if meeting.topic_time_limit >= 60 and topic.time_left == 15:
-                    send_message(text='15 second warning!', room_id=meeting.room_id)
+    for minimum_time_limit, seconds_left, text in TOPIC_WARNINGS:
+        if action == str(seconds_left):
+            send_message(text=text, room_id=meeting.room_id)
 
-                time.sleep(1)
 
-                meeting.refresh_from_db()
+@shared_task()
+def advance_topic(meeting_pk, topic_pk, started_at=None):
+    # Only timers pass a start time, which is when the topic was due to end
+    if started_at is not None:
+        metrics.observe('timers.lateness', time.time() - started_at)
+
+    current = live.get_meeting(meeting_pk)
 
-                if meeting.queue_next_topic:
-                    topic.time_left = 0
-                    meeting.queue_next_topic = False
-                else:
-                    topic.time_left -= 1
+    if current is None or current.state != Meeting.IN_PROGRESS or current.topic_pk != topic_pk:
+        return None
 
-                topic.save()
-                meeting.save()
+    next_topic = Topic.objects.filter(meeting=meeting_pk, pk__gt=topic_pk).order_by('pk').first()
 
+    # The compare-and-set lets exactly one of a racing /NEXT and timer advance the meeting
+    try:
+        if next_topic:
+            if live.transition(meeting_pk, Meeting.IN_PROGRESS, topic_pk,
+                               Meeting.IN_PROGRESS, next_topic.pk, next_topic.name):
+                scheduler.cancel(meeting_pk)
+                begin_topic(Meeting.objects.get(pk=meeting_pk), next_topic, started_at)
+        elif live.transition(meeting_pk, Meeting.IN_PROGRESS, topic_pk,
+                             Meeting.COMPLETED, topic_pk, current.topic_name):
+            scheduler.cancel(meeting_pk)
+            complete_meeting(Meeting.objects.get(pk=meeting_pk))
+    except Meeting.DoesNotExist:
+        pass
+
+
+def complete_meeting(meeting):
+    try:
         complete_text = []
         complete_text.append('########################')
         complete_text.append('Meeting complete')
@@ -286,42 +478,99 @@ def start_meeting(meeting):
         complete_message = send_message(text='\n'.join(complete_text), room_id=meeting.room_id)
 
         meeting.complete_id = complete_message['id']
-        meeting.state = Meeting.COMPLETED
-        meeting.save()
+        meeting.save(update_fields=['complete_id'])
 
         if meeting.spark_audio == True:
-            room = get_room_details(meeting.room_id)
+            room = get_room(meeting.room_id)
             message = 'Meeting is complete'
             create_session(sip_address=room['sipAddress'], message=message)
 
-        for caller in meeting.caller_set.all():
-            send_signal(session_id=caller.session_id, signal='exit')
+        send_signals(meeting.caller_set.values_list('session_id', flat=True), signal='exit')
 
         if meeting.voice_used == True:
-            count = 0
-            topic = Topic.objects.get(pk=meeting.current_topic.pk)
+            topic = Topic.objects.get(pk=meeting.current_topic_id)
+
+            # Otherwise the last transcription callback triggers delivery, with a timer as fallback
+            if topic.transcription:
+                render_transcript.delay(meeting.pk, 'complete')
+            else:
+                deadline = time.time() + settings.TRANSCRIPTION_TIMEOUT
+                scheduler.schedule(meeting.pk, topic.pk, TRANSCRIPTION_TIMEOUT, deadline)
+        else:
+            meeting.delete()
+    except (Meeting.DoesNotExist, Topic.DoesNotExist):
+        pass
+
+
+@shared_task()
+def prerender_transcript(topic_pk):
+    try:
+        topic = Topic.objects.select_related('meeting').get(pk=topic_pk)
+    except Topic.DoesNotExist:
+        return None
+
+    prerender_pdf(topic.meeting)
+
+    completed = Meeting.objects.filter(pk=topic.meeting_id, state=Meeting.COMPLETED, current_topic=topic)
+
+    if completed.exists():
+        render_transcript.delay(topic.meeting_id, 'transcription')
 
-            while count < 30 and not topic.transcription:
-                topic.refresh_from_db()
-                time.sleep(1)
-                count += 1
 
-            file_url = get_full_url(reverse('home:pdf', kwargs={'meeting_pk': meeting.pk}))
-            send_message(text=None, room_id=meeting.room_id, file_url=file_url)
+@shared_task(bind=True, max_retries=3, default_retry_delay=30)
+def render_transcript(self, meeting_pk, trigger, due=None):
+    if due is not None and not self.request.retries:
+        metrics.observe('timers.lateness', time.time() - due)
 
-        meeting.delete()
+    # The transcription event, the timeout and completion itself may all fire, only one delivers
+    redis = get_redis()
+    claim_key = TRANSCRIPT_CLAIM_KEY.format(meeting_pk)
+
+    if not redis.set(claim_key, 1, nx=True, ex=settings.TRANSCRIPT_CACHE_TTL):
+        return None
+
+    try:
+        meeting = Meeting.objects.get(pk=meeting_pk)
     except Meeting.DoesNotExist:
-        pass
+        return None
+
+    retrying = False
+
+    try:
+        render_pdf(meeting)
+
+        file_url = get_full_url(reverse('home:pdf', kwargs={'meeting_pk': meeting.pk}))
+        send_message(text=None, room_id=meeting.room_id, file_url=file_url)
+
+        metrics.incr('transcripts.delivered.{0}'.format(trigger))
+    except Exception as error:
+        # Giving the claim back lets the retry, or the fallback timer, deliver instead
+        redis.delete(claim_key)
+        metrics.incr('transcripts.failed')
+
+        retrying = self.request.retries < self.max_retries
+
+        if retrying:
+            raise self.retry(exc=error)
+
+        raise
+    finally:
+        # Once delivery is settled the room is freed whether or not the transcript made it
+        if not retrying:
+            scheduler.cancel(meeting_pk)
+            meeting.delete()
 
 
 def get_meeting_status(meeting):
     MINUTES = 1
     SECONDS = 2
 
-    topic_time_span = str(timedelta(seconds=meeting.current_topic.time_left)).split(':')
+    time_left = max(int(round(meeting.deadline - time.time())), 0) if meeting.deadline else 0
+
+    topic_time_span = str(timedelta(seconds=time_left)).split(':')
 
     status = []
-    status.append('Current topic: {0}'.format(meeting.current_topic.name))
+    status.append('Current topic: {0}'.format(meeting.topic_name))
     status.append('Time left for topic: {0} minutes {1} seconds'.format(
         topic_time_span[MINUTES],
         topic_time_span[SECONDS]
@@ -331,17 +580,20 @@ def get_meeting_status(meeting):
 
 
 def cancel_meeting(meeting):
+    # Canceling the live state first makes any in-flight topic transition fail
     meeting.state = Meeting.CANCELED
-    meeting.save()
+    live.set_state(meeting.pk, Meeting.CANCELED)
+    Meeting.objects.filter(pk=meeting.pk).update(state=Meeting.CANCELED)
+
+    scheduler.cancel(meeting.pk)
 
     message = 'Meeting has been canceled'
 
     if meeting.spark_audio == True:
-        room = get_room_details(meeting.room_id)
+        room = get_room(meeting.room_id)
         create_session(sip_address=room['sipAddress'], message=message)
 
-    for caller in meeting.caller_set.all():
-        send_signal(session_id=caller.session_id, signal='exit')
+    send_signals(meeting.caller_set.values_list('session_id', flat=True), signal='exit')
 
     send_message(text=message, room_id=meeting.room_id)
     meeting.delete()
@@ -1,3 +1,694 @@
-from django.test import TestCase
+import json
+import os
+import threading
+import time
+from itertools import islice
+from unittest import mock
 
-# Create your tests here.
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from requests.exceptions import ConnectTimeout, ReadTimeout
+
+from spark.celery import app
+from spark.helpers import get_redis
+from . import beat, cache, calls, client, commands, live, scheduler
+from .commands import Command, parse_command
+from .hooks import get_byte_range, meeting_pdf, voice_next
+from .models import Meeting, Topic
+from .tasks import TRANSCRIPT_CLAIM_KEY, advance_topic, fire_timer, render_transcript, start_meeting
+
+# Tests that touch Redis expect REDIS_URL to point at a scratch database
+
+
+class SchedulerTests(SimpleTestCase):
+    meeting_pk = 990001
+    other_meeting_pk = 990002
+
+    def tearDown(self):
+        scheduler.cancel(self.meeting_pk)
+        scheduler.cancel(self.other_meeting_pk)
+
+    def pop_due(self, now):
+        meeting_pks = (self.meeting_pk, self.other_meeting_pk)
+        return [timer for timer in scheduler.pop_due(now=now) if timer.meeting_pk in meeting_pks]
+
+    def test_pop_due_returns_only_due_timers(self):
+        scheduler.schedule(self.meeting_pk, 7, 'end', 100)
+        scheduler.schedule(self.meeting_pk, 8, 'end', 200)
+
+        self.assertEqual(self.pop_due(150), [scheduler.Timer(self.meeting_pk, 7, 'end', 100.0)])
+        self.assertEqual(self.pop_due(250), [scheduler.Timer(self.meeting_pk, 8, 'end', 200.0)])
+
+    def test_pop_due_keeps_meeting_timers_without_topic(self):
+        scheduler.schedule(self.meeting_pk, None, 'start', 100)
+
+        self.assertEqual(self.pop_due(150), [scheduler.Timer(self.meeting_pk, None, 'start', 100.0)])
+
+    def test_pop_due_returns_each_timer_once(self):
+        scheduler.schedule(self.meeting_pk, 7, 'end', 100)
+
+        self.assertEqual(len(self.pop_due(150)), 1)
+        self.assertEqual(self.pop_due(150), [])
+
+    def test_rescheduling_replaces_the_due_time(self):
+        scheduler.schedule(self.meeting_pk, 7, 'end', 100)
+        scheduler.schedule(self.meeting_pk, 7, 'end', 300)
+
+        self.assertEqual(self.pop_due(150), [])
+        self.assertEqual(self.pop_due(350), [scheduler.Timer(self.meeting_pk, 7, 'end', 300.0)])
+
+    def test_cancel_only_removes_the_meeting_timers(self):
+        scheduler.schedule(self.meeting_pk, 7, 'end', 100)
+        scheduler.schedule(self.meeting_pk, 7, '60', 90)
+        scheduler.schedule(self.other_meeting_pk, 9, 'end', 100)
+
+        scheduler.cancel(self.meeting_pk)
+
+        self.assertEqual(self.pop_due(150), [scheduler.Timer(self.other_meeting_pk, 9, 'end', 100.0)])
+
+    def test_concurrent_pop_due_hands_out_each_timer_once(self):
+        for topic_pk in range(1, 201):
+            scheduler.schedule(self.meeting_pk, topic_pk, 'end', 100)
+
+        popped = []
+        lock = threading.Lock()
+
+        def pop():
+            timers = self.pop_due(150)
+
+            with lock:
+                popped.extend(timers)
+
+        threads = [threading.Thread(target=pop) for _ in range(8)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(timer.topic_pk for timer in popped), list(range(1, 201)))
+
+
+class ParseCommandTests(SimpleTestCase):
+    corpus = (
+        ('', None),
+        (None, None),
+        ('Morning all, running five minutes late', None),
+        ('Can someone share the deck from yesterday?', None),
+        ('please /start', None),
+        ('/unknown', None),
+        ('/meet10 Roadmap, Hiring, Budget', Command(commands.MEET, '10 Roadmap, Hiring, Budget')),
+        ('/MEET$! Retro', Command(commands.MEET, '$! Retro')),
+        ('/meet?', Command(commands.HELP, None)),
+        ('/meet?\n', Command(commands.HELP, None)),
+        ('/meet? Roadmap', Command(commands.MEET, '? Roadmap')),
+        ('/start', Command(commands.START, None)),
+        ('/START', Command(commands.START, None)),
+        ('//start', Command(commands.START, None)),
+        ('/start now', None),
+        ('/status\n', Command(commands.STATUS, None)),
+        ('/next', Command(commands.NEXT, None)),
+        ('/next\nand then some', None),
+        ('/Cancel', Command(commands.CANCEL, None)),
+    )
+
+    def test_corpus(self):
+        for text, expected in self.corpus:
+            self.assertEqual(parse_command(text), expected, text)
+
+    def test_meet_parameters(self):
+        match = commands.MEET_PARAMETERS_PATTERN.match('$15 Roadmap, Hiring')
+
+        self.assertEqual(match.group('sip'), '$')
+        self.assertEqual(match.group('time'), '15')
+        self.assertEqual(match.group('topics'), 'Roadmap, Hiring')
+
+    def test_meet_parameters_without_time(self):
+        match = commands.MEET_PARAMETERS_PATTERN.match('! Retro')
+
+        self.assertEqual(match.group('sip'), '')
+        self.assertEqual(match.group('time'), '!')
+        self.assertEqual(match.group('topics'), 'Retro')
+
+
+class RecordingClaimTests(TransactionTestCase):
+    threads = 50
+    requests_per_thread = 6
+
+    def setUp(self):
+        self.meeting = Meeting.objects.create(room_name='Room', room_id='room', voice_id='990001', state=Meeting.IN_PROGRESS)
+        self.topic = self.meeting.topic_set.create(name='Roadmap')
+        self.meeting.current_topic = self.topic
+        self.meeting.save()
+        live.publish(self.meeting)
+
+    def tearDown(self):
+        key = '{0}:{1}:{2}'.format(self.meeting.pk, Meeting.IN_PROGRESS, self.topic.pk)
+        get_redis().delete(cache.VOICE_RESPONSE_KEY.format(key))
+        live.clear(self.meeting)
+
+    @mock.patch.dict(os.environ, {'DOMAIN_URL': 'https://meet.example.com'})
+    def test_one_caller_starts_the_recording(self):
+        factory = RequestFactory()
+        barrier = threading.Barrier(self.threads)
+        responses = []
+        lock = threading.Lock()
+
+        def call():
+            try:
+                barrier.wait()
+
+                for _ in range(self.requests_per_thread):
+                    response = voice_next(factory.post('/home/voice/next/'), meeting_pk=self.meeting.pk)
+
+                    with lock:
+                        responses.append(response.content.decode('utf-8'))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=call) for _ in range(self.threads)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(responses), self.threads * self.requests_per_thread)
+        self.assertEqual(sum('startRecording' in response for response in responses), 1)
+        self.assertTrue(Topic.objects.get(pk=self.topic.pk).recording)
+
+
+@mock.patch('meet.hooks.get_pdf', return_value=('abc', b'0123456789'))
+class MeetingPdfTests(TestCase):
+    def get(self, **headers):
+        return meeting_pdf(RequestFactory().get('/home/1.pdf', **headers), meeting_pk=1)
+
+    def test_full_response(self, get_pdf):
+        response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'0123456789')
+        self.assertEqual(response['ETag'], '"abc"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_matching_etag_is_not_modified(self, get_pdf):
+        response = self.get(HTTP_IF_NONE_MATCH='"abc"')
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], '"abc"')
+
+    def test_stale_etag_gets_the_file(self, get_pdf):
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH='"old"').status_code, 200)
+
+    def test_range(self, get_pdf):
+        response = self.get(HTTP_RANGE='bytes=2-5')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+
+    def test_open_ended_range(self, get_pdf):
+        response = self.get(HTTP_RANGE='bytes=7-')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b'789')
+        self.assertEqual(response['Content-Range'], 'bytes 7-9/10')
+
+    def test_suffix_range(self, get_pdf):
+        response = self.get(HTTP_RANGE='bytes=-3')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, b'789')
+
+    def test_unsatisfiable_range(self, get_pdf):
+        response = self.get(HTTP_RANGE='bytes=20-')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_invalid_range_gets_the_file(self, get_pdf):
+        response = self.get(HTTP_RANGE='bytes=5-2')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'0123456789')
+
+    def test_missing_meeting(self, get_pdf):
+        get_pdf.return_value = (None, None)
+
+        with self.assertRaises(Http404):
+            self.get()
+
+
+class ByteRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        self.assertEqual(get_byte_range('bytes=0-3', 10), (0, 3))
+        self.assertEqual(get_byte_range('bytes=4-', 10), (4, 9))
+        self.assertEqual(get_byte_range('bytes=-4', 10), (6, 9))
+        self.assertEqual(get_byte_range('bytes=-40', 10), (0, 9))
+        self.assertEqual(get_byte_range('bytes=0-40', 10), (0, 9))
+        self.assertEqual(get_byte_range('bytes=12-', 10), (12, 9))
+
+    def test_ignored_headers(self):
+        self.assertIsNone(get_byte_range('', 10))
+        self.assertIsNone(get_byte_range('bytes=-', 10))
+        self.assertIsNone(get_byte_range('bytes=5-2', 10))
+        self.assertIsNone(get_byte_range('bytes=0-1,4-5', 10))
+        self.assertIsNone(get_byte_range('items=0-1', 10))
+
+
+class LeaderSchedulerTests(SimpleTestCase):
+    def setUp(self):
+        get_redis().delete(beat.LEADER_KEY)
+        self.first = beat.LeaderScheduler(app=app, schedule_filename='celerybeat-test', lazy=True)
+        self.second = beat.LeaderScheduler(app=app, schedule_filename='celerybeat-test', lazy=True)
+
+    def tearDown(self):
+        get_redis().delete(beat.LEADER_KEY)
+
+    def test_only_one_node_leads(self):
+        self.assertTrue(self.first.elect())
+        self.assertFalse(self.second.elect())
+        self.assertTrue(self.first.elect())
+
+    def test_leadership_fails_over_when_the_lease_expires(self):
+        self.first.elect()
+        get_redis().delete(beat.LEADER_KEY)
+
+        self.assertTrue(self.second.elect())
+        self.assertFalse(self.first.elect())
+        self.assertFalse(self.first.leader)
+
+    def test_renewal_extends_the_lease(self):
+        self.first.elect()
+        get_redis().expire(beat.LEADER_KEY, 1)
+
+        self.first.elect()
+        self.assertGreater(get_redis().ttl(beat.LEADER_KEY), 1)
+
+
+class FireTimerTests(SimpleTestCase):
+    # Timer workers only hand work to the other queues, they never run it inline
+    @mock.patch('meet.tasks.start_meeting')
+    def test_start(self, start_meeting):
+        due = time.time()
+        fire_timer(1, None, 'start', due)
+        start_meeting.delay.assert_called_once_with(1, due=due)
+
+    @mock.patch('meet.tasks.advance_topic')
+    def test_topic_end(self, advance_topic):
+        due = time.time()
+        fire_timer(1, 2, 'end', due)
+        advance_topic.delay.assert_called_once_with(1, 2, started_at=due)
+
+    @mock.patch('meet.tasks.render_transcript')
+    def test_transcription_timeout(self, render_transcript):
+        due = time.time()
+        fire_timer(1, 2, 'transcription', due)
+        render_transcript.delay.assert_called_once_with(1, 'timeout', due=due)
+
+    @mock.patch('meet.tasks.send_topic_warning')
+    def test_warning(self, send_topic_warning):
+        due = time.time()
+        fire_timer(1, 2, '60', due)
+        send_topic_warning.delay.assert_called_once_with(1, 2, '60', due)
+
+
+def get_response(status_code, headers=None):
+    return mock.Mock(status_code=status_code, headers=headers or {})
+
+
+@override_settings(HTTP_CONNECT_TIMEOUT=3, HTTP_READ_TIMEOUT=10, HTTP_MAX_RETRIES=3,
+                   HTTP_BACKOFF_BASE=0.5, HTTP_BACKOFF_MAX=30)
+@mock.patch('meet.client.time.sleep')
+class ClientRequestTests(SimpleTestCase):
+    url = 'https://api.ciscospark.com/v1/messages'
+
+    def setUp(self):
+        self.session = mock.Mock()
+        patcher = mock.patch('meet.client.get_session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_default_timeout(self, sleep):
+        self.session.request.return_value = get_response(200)
+        client.get(self.url)
+        self.session.request.assert_called_once_with('GET', self.url, timeout=(3, 10))
+
+    def test_explicit_timeout_wins(self, sleep):
+        self.session.request.return_value = get_response(200)
+        client.get(self.url, timeout=1)
+        self.session.request.assert_called_once_with('GET', self.url, timeout=1)
+
+    def test_get_retries_server_errors(self, sleep):
+        self.session.request.side_effect = [get_response(503), get_response(502), get_response(200)]
+
+        self.assertEqual(client.get(self.url).status_code, 200)
+        self.assertEqual(self.session.request.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_get_gives_up_after_max_retries(self, sleep):
+        self.session.request.return_value = get_response(500)
+
+        self.assertEqual(client.get(self.url).status_code, 500)
+        self.assertEqual(self.session.request.call_count, 4)
+
+    def test_get_retries_read_timeouts(self, sleep):
+        self.session.request.side_effect = [ReadTimeout(), get_response(200)]
+
+        self.assertEqual(client.get(self.url).status_code, 200)
+
+    def test_get_raises_after_max_retries(self, sleep):
+        self.session.request.side_effect = ReadTimeout()
+
+        with self.assertRaises(ReadTimeout):
+            client.get(self.url)
+
+        self.assertEqual(self.session.request.call_count, 4)
+
+    def test_post_is_not_retried_on_server_errors(self, sleep):
+        self.session.request.return_value = get_response(503)
+
+        self.assertEqual(client.post(self.url).status_code, 503)
+        self.assertEqual(self.session.request.call_count, 1)
+        sleep.assert_not_called()
+
+    def test_post_is_not_retried_on_read_timeouts(self, sleep):
+        self.session.request.side_effect = ReadTimeout()
+
+        with self.assertRaises(ReadTimeout):
+            client.post(self.url)
+
+        self.assertEqual(self.session.request.call_count, 1)
+
+    def test_post_is_retried_on_connect_timeouts(self, sleep):
+        self.session.request.side_effect = [ConnectTimeout(), get_response(200)]
+
+        self.assertEqual(client.post(self.url).status_code, 200)
+        self.assertEqual(self.session.request.call_count, 2)
+
+    def test_post_can_opt_in_to_retries(self, sleep):
+        self.session.request.side_effect = [get_response(503), get_response(200)]
+
+        self.assertEqual(client.post(self.url, idempotent=True).status_code, 200)
+
+    def test_too_many_requests_honours_retry_after(self, sleep):
+        self.session.request.side_effect = [get_response(429, {'Retry-After': '7'}), get_response(200)]
+
+        self.assertEqual(client.post(self.url).status_code, 200)
+        sleep.assert_called_once_with(7.0)
+
+    def test_retry_after_is_capped(self, sleep):
+        self.session.request.side_effect = [get_response(429, {'Retry-After': '3600'}), get_response(200)]
+
+        client.get(self.url)
+        sleep.assert_called_once_with(30)
+
+    def test_invalid_retry_after_falls_back_to_backoff(self, sleep):
+        self.session.request.side_effect = [get_response(429, {'Retry-After': 'soon'}), get_response(200)]
+
+        client.get(self.url)
+        self.assertLessEqual(sleep.call_args[0][0], 0.5)
+
+    def test_backoff_is_capped(self, sleep):
+        for attempt in range(20):
+            self.assertLessEqual(client.get_backoff(attempt), 30)
+
+
+def get_page(items, next_url=None):
+    links = {'next': {'url': next_url}} if next_url else {}
+    return mock.Mock(content=json.dumps({'items': items}).encode(), links=links)
+
+
+@override_settings(SPARK_PAGE_SIZE=2)
+@mock.patch('meet.calls.client.get')
+class GetItemsTests(SimpleTestCase):
+    url = 'https://api.ciscospark.com/v1/memberships'
+    next_url = 'https://api.ciscospark.com/v1/memberships?roomId=room&max=2&cursor=abc'
+
+    def test_follows_next_links(self, get):
+        get.side_effect = [get_page([1, 2], self.next_url), get_page([3])]
+
+        self.assertEqual(list(calls.get_items(self.url, params={'roomId': 'room'})), [1, 2, 3])
+        self.assertEqual(get.call_args_list, [
+            mock.call(self.url, params={'roomId': 'room', 'max': 2}, headers=calls.SPARK_HEADERS),
+            mock.call(self.next_url, params=None, headers=calls.SPARK_HEADERS),
+        ])
+
+    def test_page_size_overrides_setting(self, get):
+        get.return_value = get_page([])
+
+        list(calls.get_items(self.url, page_size=100))
+        self.assertEqual(get.call_args[1]['params'], {'max': 100})
+
+    def test_stops_fetching_when_consumer_stops(self, get):
+        get.side_effect = [get_page([1, 2], self.next_url), get_page([3, 4], self.next_url)]
+
+        self.assertEqual(list(islice(calls.get_room_memberships('room'), 2)), [1, 2])
+        self.assertEqual(get.call_count, 1)
+
+
+class LiveStateTests(TransactionTestCase):
+    threads = 20
+
+    def setUp(self):
+        self.meeting = Meeting.objects.create(room_name='Room', room_id='room', voice_id='990001', state=Meeting.IN_PROGRESS)
+        self.topic = self.meeting.topic_set.create(name='Roadmap')
+        self.next_topic = self.meeting.topic_set.create(name='Hiring')
+        self.meeting.current_topic = self.topic
+        self.meeting.save()
+        live.publish(self.meeting)
+
+    def tearDown(self):
+        scheduler.cancel(self.meeting.pk)
+        live.clear(self.meeting)
+
+    def get_state(self):
+        return get_redis().hgetall(live.LIVE_KEY.format(self.meeting.pk))
+
+    def race(self, func):
+        barrier = threading.Barrier(self.threads)
+        results = []
+        lock = threading.Lock()
+
+        def call(index):
+            try:
+                barrier.wait()
+                result = func(index)
+
+                with lock:
+                    results.append(result)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=call, args=(index,)) for index in range(self.threads)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        return results
+
+    def test_one_transition_wins(self):
+        results = self.race(lambda index: live.transition(
+            self.meeting.pk, Meeting.IN_PROGRESS, self.topic.pk,
+            Meeting.IN_PROGRESS, self.next_topic.pk, self.next_topic.name
+        ))
+
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(Meeting.objects.get(pk=self.meeting.pk).current_topic_id, self.next_topic.pk)
+        self.assertEqual(self.get_state()['topic'], str(self.next_topic.pk))
+
+    @mock.patch('meet.tasks.begin_topic')
+    def test_next_command_and_timer_advance_once(self, begin_topic):
+        due = time.time()
+
+        # Half the callers are /NEXT commands and half are the topic end timer
+        def advance(index):
+            if index % 2:
+                advance_topic(self.meeting.pk, self.topic.pk)
+            else:
+                advance_topic(self.meeting.pk, self.topic.pk, started_at=due)
+
+        self.race(advance)
+
+        self.assertEqual(begin_topic.call_count, 1)
+        self.assertEqual(begin_topic.call_args[0][1], self.next_topic)
+
+    def test_get_meeting_reloads_missing_state(self):
+        live.clear(self.meeting)
+
+        meeting = live.get_meeting(self.meeting.pk)
+
+        self.assertEqual(meeting.state, Meeting.IN_PROGRESS)
+        self.assertEqual(meeting.topic_pk, self.topic.pk)
+        self.assertEqual(self.get_state()['topic'], str(self.topic.pk))
+        self.assertEqual(live.get_room_meeting('room').pk, self.meeting.pk)
+
+    def test_transition_reloads_missing_state(self):
+        live.clear(self.meeting)
+
+        self.assertTrue(live.transition(self.meeting.pk, Meeting.IN_PROGRESS, self.topic.pk,
+                                        Meeting.IN_PROGRESS, self.next_topic.pk, self.next_topic.name))
+        self.assertEqual(self.get_state()['topic_name'], 'Hiring')
+
+    def test_set_state_reloads_a_full_hash(self):
+        live.clear(self.meeting)
+
+        live.set_state(self.meeting.pk, Meeting.CANCELED)
+
+        state = self.get_state()
+        self.assertEqual(state['state'], str(Meeting.CANCELED))
+        self.assertEqual(state['room_id'], 'room')
+        self.assertEqual(state['topic'], str(self.topic.pk))
+
+    def test_set_state_without_meeting_creates_nothing(self):
+        live.set_state(999999, Meeting.CANCELED)
+
+        self.assertFalse(get_redis().exists(live.LIVE_KEY.format(999999)))
+
+    def test_set_deadline_is_ignored_after_topic_moved_on(self):
+        live.transition(self.meeting.pk, Meeting.IN_PROGRESS, self.topic.pk,
+                        Meeting.IN_PROGRESS, self.next_topic.pk, self.next_topic.name)
+
+        live.set_deadline(self.meeting.pk, self.topic.pk, 1000)
+        self.assertEqual(self.get_state()['deadline'], '')
+
+        live.set_deadline(self.meeting.pk, self.next_topic.pk, 2000)
+        self.assertEqual(live.get_meeting(self.meeting.pk).deadline, 2000.0)
+
+
+@mock.patch('meet.tasks.send_signals')
+@mock.patch('meet.tasks.send_message', return_value={'id': 'message'})
+class MeetingFlowTests(TestCase):
+    def setUp(self):
+        self.meeting = Meeting.objects.create(room_name='Room', room_id='room', voice_id='990001', topic_time_limit=300)
+        self.topics = [self.meeting.topic_set.create(name=name) for name in ('Roadmap', 'Hiring')]
+        live.publish(self.meeting)
+        scheduler.schedule(self.meeting.pk, None, 'start', time.time() + 60)
+
+    def tearDown(self):
+        scheduler.cancel(self.meeting.pk)
+        live.clear(self.meeting)
+
+    def get_timers(self):
+        return get_redis().smembers(scheduler.MEETING_TIMERS_KEY.format(self.meeting.pk))
+
+    def test_start_advance_complete(self, send_message, send_signals):
+        first, second = self.topics
+
+        start_meeting(self.meeting.pk)
+
+        meeting = live.get_meeting(self.meeting.pk)
+        self.assertEqual((meeting.state, meeting.topic_pk), (Meeting.IN_PROGRESS, first.pk))
+        self.assertIsNotNone(meeting.deadline)
+        self.assertEqual(Topic.objects.get(pk=first.pk).message_id, 'message')
+        self.assertIn('{0}:{1}:end'.format(self.meeting.pk, first.pk), self.get_timers())
+        self.assertNotIn('{0}:0:start'.format(self.meeting.pk), self.get_timers())
+
+        # A second /START is a no-op
+        start_meeting(self.meeting.pk)
+        self.assertEqual(live.get_meeting(self.meeting.pk).topic_pk, first.pk)
+
+        advance_topic(self.meeting.pk, first.pk)
+
+        self.assertEqual(live.get_meeting(self.meeting.pk).topic_pk, second.pk)
+        self.assertEqual(self.get_timers(), set(
+            '{0}:{1}:{2}'.format(self.meeting.pk, second.pk, action) for action in ('120', '60', '15', 'end')
+        ))
+
+        # A stale advance for the topic already left behind changes nothing
+        advance_topic(self.meeting.pk, first.pk)
+        self.assertEqual(live.get_meeting(self.meeting.pk).topic_pk, second.pk)
+
+        advance_topic(self.meeting.pk, second.pk)
+
+        self.assertFalse(Meeting.objects.filter(pk=self.meeting.pk).exists())
+        self.assertFalse(get_redis().exists(live.LIVE_KEY.format(self.meeting.pk)))
+        self.assertEqual(self.get_timers(), set())
+        self.assertIn('Meeting complete', send_message.call_args[1]['text'])
+        self.assertEqual(send_signals.call_args[1], {'signal': 'exit'})
+
+
+class RetryTranscript(Exception):
+    pass
+
+
+@mock.patch.dict(os.environ, {'DOMAIN_URL': 'https://meet.example.com'})
+@mock.patch('meet.tasks.send_message')
+@mock.patch('meet.tasks.render_pdf')
+class RenderTranscriptTests(TransactionTestCase):
+    threads = 10
+
+    def setUp(self):
+        self.meeting = Meeting.objects.create(room_name='Room', room_id='room', voice_id='990001',
+                                              state=Meeting.COMPLETED, voice_used=True)
+        self.topic = self.meeting.topic_set.create(name='Roadmap')
+        scheduler.schedule(self.meeting.pk, self.topic.pk, 'transcription', time.time() + 60)
+
+    def tearDown(self):
+        get_redis().delete(TRANSCRIPT_CLAIM_KEY.format(self.meeting.pk))
+        scheduler.cancel(self.meeting.pk)
+
+    def get_timers(self):
+        return get_redis().smembers(scheduler.MEETING_TIMERS_KEY.format(self.meeting.pk))
+
+    def test_completion_and_transcription_deliver_once(self, render_pdf, send_message):
+        barrier = threading.Barrier(self.threads)
+        triggers = ('complete', 'transcription', 'timeout')
+
+        def call(trigger):
+            try:
+                barrier.wait()
+                render_transcript(self.meeting.pk, trigger)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=call, args=(triggers[index % len(triggers)],))
+                   for index in range(self.threads)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(send_message.call_count, 1)
+        self.assertEqual(send_message.call_args[1]['file_url'], 'https://meet.example.com{0}'.format(
+            reverse('home:pdf', kwargs={'meeting_pk': self.meeting.pk})))
+        self.assertFalse(Meeting.objects.filter(pk=self.meeting.pk).exists())
+        self.assertEqual(self.get_timers(), set())
+
+    def test_failure_releases_the_claim_and_retries(self, render_pdf, send_message):
+        send_message.side_effect = ValueError('Spark unavailable')
+
+        with mock.patch.object(render_transcript, 'retry', side_effect=RetryTranscript) as retry:
+            with self.assertRaises(RetryTranscript):
+                render_transcript(self.meeting.pk, 'complete')
+
+        self.assertIs(retry.call_args[1]['exc'], send_message.side_effect)
+        self.assertFalse(get_redis().exists(TRANSCRIPT_CLAIM_KEY.format(self.meeting.pk)))
+        self.assertTrue(Meeting.objects.filter(pk=self.meeting.pk).exists())
+        self.assertNotEqual(self.get_timers(), set())
+
+        # The retry can claim the delivery again
+        send_message.side_effect = None
+        render_transcript(self.meeting.pk, 'complete')
+
+        self.assertEqual(send_message.call_count, 2)
+        self.assertFalse(Meeting.objects.filter(pk=self.meeting.pk).exists())
+
+    def test_final_failure_frees_the_room(self, render_pdf, send_message):
+        send_message.side_effect = ValueError('Spark unavailable')
+
+        with self.assertRaises(ValueError):
+            render_transcript.apply(args=[self.meeting.pk, 'complete'], retries=render_transcript.max_retries, throw=True)
+
+        self.assertFalse(Meeting.objects.filter(pk=self.meeting.pk).exists())
+        self.assertEqual(self.get_timers(), set())
@@ -0,0 +1,58 @@
+import hashlib
+from io import BytesIO
+
+from django.conf import settings
+
+from spark.helpers import get_redis
+from . import codec, metrics
+from .models import MeetingTranscription, build_section, get_section_markup
+
+PDF_KEY = 'meet:pdf:{0}'
+MEETING_PDF_KEY = 'meet:pdf:meeting:{0}'
+
+
+def get_content_hash(content):
+    return hashlib.sha256(codec.dumps(content).encode('utf-8')).hexdigest()
+
+
+def build_pdf(meeting):
+    topics = list(meeting.topic_set.all().order_by('pk'))
+    digest = get_content_hash([[topic.name, topic.transcription] for topic in topics])
+    redis = get_redis(decode_responses=False)
+
+    pdf = redis.get(PDF_KEY.format(digest))
+
+    if pdf is None:
+        metrics.incr('transcripts.render')
+        sections = [build_section(get_section_markup(topic)) for topic in topics]
+        meeting_transcription = MeetingTranscription(meeting=meeting, buffer=BytesIO(), sections=sections)
+        pdf = meeting_transcription.create_pdf()
+        redis.setex(PDF_KEY.format(digest), settings.TRANSCRIPT_CACHE_TTL, pdf)
+
+    return digest, pdf
+
+
+def prerender_pdf(meeting):
+    # PDFs are addressed by content, so delivery finds this one cached unless a transcription changed since
+    build_pdf(meeting)
+
+
+def render_pdf(meeting):
+    digest, pdf = build_pdf(meeting)
+    get_redis(decode_responses=False).setex(MEETING_PDF_KEY.format(meeting.pk), settings.TRANSCRIPT_CACHE_TTL, digest)
+    return digest, pdf
+
+
+def get_pdf(meeting_pk):
+    redis = get_redis(decode_responses=False)
+    digest = redis.get(MEETING_PDF_KEY.format(meeting_pk))
+
+    if digest is not None:
+        pdf = redis.get(PDF_KEY.format(digest.decode('utf-8')))
+
+        if pdf is not None:
+            metrics.incr('transcripts.hit')
+            return digest.decode('utf-8'), pdf
+
+    metrics.incr('transcripts.miss')
+    return None, None
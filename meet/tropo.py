@@ -31,28 +31,17 @@ NOTE: This module requires python 2.5 or higher.
 
 """
 
-try:
-    import cjson as jsonlib
-
-    jsonlib.dumps = jsonlib.encode
-    jsonlib.loads = jsonlib.decode
-except ImportError:
-    try:
-        from django.utils import simplejson as jsonlib
-    except ImportError:
-        try:
-            import simplejson as jsonlib
-        except ImportError:
-            import json as jsonlib
-
 import logging
 
+from . import codec as jsonlib
+
 
 class TropoAction(object):
     """
     Class representing the base Tropo action.
     Two properties are provided in order to avoid defining the same attributes for every action.
     """
+    __slots__ = ()
 
     @property
     def json(self):
@@ -86,6 +75,7 @@ class Ask(TropoAction):
             "voice": String } } 
 
     """
+    __slots__ = ('_dict',)
     action = 'ask'
     options_array = ['attempts', 'bargein', 'choices', 'minConfidence', 'name', 'recognizer', 'required', 'say',
                      'timeout', 'voice']
@@ -125,6 +115,7 @@ class Call(TropoAction):
         "required": Boolean,
         "timeout": Float } } 
     """
+    __slots__ = ('_dict',)
     action = 'call'
     options_array = ['answerOnMedia', 'channel', 'from', 'headers', 'name', 'network', 'recording', 'required',
                      'timeout']
@@ -143,6 +134,7 @@ class Choices(TropoAction):
 
     (See https://www.tropo.com/docs/webapi/ask.htm)
     """
+    __slots__ = ('_dict',)
     action = 'choices'
     options_array = ['terminator', 'mode']
 
@@ -170,6 +162,7 @@ class Conference(TropoAction):
         "required": Boolean,
         "terminator": String } } 
     """
+    __slots__ = ('_dict',)
     action = 'conference'
     options_array = ['mute', 'name', 'playTones', 'required', 'terminator', 'allowSignals']
 
@@ -191,6 +184,7 @@ class Hangup(TropoAction):
 
     { "hangup": { } } 
     """
+    __slots__ = ('_dict',)
     action = 'hangup'
 
     def __init__(self):
@@ -218,6 +212,7 @@ class Message(TropoAction):
             "timeout": Float,
             "voice": String } } 
     """
+    __slots__ = ('_dict',)
     action = 'message'
     options_array = ['answerOnMedia', 'channel', 'from', 'name', 'network', 'required', 'timeout', 'voice']
 
@@ -244,6 +239,7 @@ class On(TropoAction):
         "required": Boolean,
         "say": Object } } 
     """
+    __slots__ = ('_dict',)
     action = 'on'
     options_array = ['name', 'next', 'required', 'say']
 
@@ -285,6 +281,7 @@ class Record(TropoAction):
             "url": String,#Required ?????
             "username": String } } 
     """
+    __slots__ = ('_dict',)
     action = 'record'
     options_array = ['attempts', 'bargein', 'beep', 'choices', 'format', 'maxSilence', 'maxTime', 'method',
                      'minConfidence', 'name', 'password', 'required', 'say', 'timeout', 'transcription', 'url',
@@ -314,6 +311,7 @@ class Redirect(TropoAction):
         "name": String,
         "required": Boolean } } 
     """
+    __slots__ = ('_dict',)
     action = 'redirect'
     options_array = ['name', 'required']
 
@@ -335,6 +333,7 @@ class Reject(TropoAction):
 
     { "reject": { } } 
     """
+    __slots__ = ('_dict',)
     action = 'reject'
 
     def __init__(self):
@@ -357,6 +356,7 @@ class Say(TropoAction):
         "value": String #Required
         } } 
     """
+    __slots__ = ('_list',)
     action = 'say'
     options_array = ['as', 'name', 'required']
 
@@ -404,6 +404,7 @@ class StartRecording(TropoAction):
         "transcriptionEmailFormat":String
         "transcriptionOutURI": String} }
     """
+    __slots__ = ('_dict',)
     action = 'startRecording'
     options_array = ['asyncUpload', 'format', 'method', 'username', 'password', 'transcriptionID',
                      'transcriptionEmailFormat',
@@ -426,6 +427,7 @@ class StopRecording(TropoAction):
     (See https://www.tropo.com/docs/webapi/stoprecording.htm)
        { "stopRecording": { } }
     """
+    __slots__ = ('_dict',)
     action = 'stopRecording'
 
     def __init__(self):
@@ -450,6 +452,7 @@ class Transfer(TropoAction):
         "terminator": String,
         "timeout": Float } } 
     """
+    __slots__ = ('_dict',)
     action = 'transfer'
     options_array = ['answerOnMedia', 'choices', 'from', 'name', 'required', 'terminator']
 
@@ -477,6 +480,7 @@ class Wait(TropoAction):
         "allowSignals": String or Array
     """
 
+    __slots__ = ('_dict',)
     action = 'wait'
     options_array = ['allowSignals']
 
@@ -505,7 +509,7 @@ class Result(object):
     options_array = ['actions', 'complete', 'error', 'sequence', 'sessionDuration', 'sessionId', 'state']
 
     def __init__(self, result_json):
-        logging.info("result POST data: %s" % result_json)
+        logging.info("result POST data: %s", result_json)
         result_data = jsonlib.loads(result_json)
         result_dict = result_data['result']
 
@@ -525,7 +529,7 @@ class Result(object):
         else:
             logging.info("Actions is a dict")
             dict = actions
-        logging.info("Actions is: %s" % actions)
+        logging.info("Actions is: %s", actions)
         return dict['interpretation']
 
     def getSessionID(self):
@@ -542,14 +546,14 @@ class Session(object):
     """
 
     def __init__(self, session_json):
-        logging.info("POST data: %s" % session_json)
+        logging.info("POST data: %s", session_json)
 
         session_data = jsonlib.loads(session_json)
         session_dict = session_data['session']
 
         for key in session_dict:
             val = session_dict[key]
-            logging.info("key: %s val: %s" % (key, val))
+            logging.info("key: %s val: %s", key, val)
             setattr(self, key, val)
 
 
@@ -566,6 +570,8 @@ class Tropo(object):
       https://www.tropo.com/docs/webapi/
     """
 
+    __slots__ = ('_steps',)
+
     def __init__(self):
         self._steps = []
 
@@ -704,14 +710,14 @@ class Tropo(object):
         steps = self._steps
         topdict = {}
         topdict['tropo'] = steps
-        logging.info("topdict: %s" % topdict)
+        logging.info("topdict: %s", topdict)
         if pretty:
             try:
                 json = jsonlib.dumps(topdict, indent=4, sort_keys=False)
             except TypeError:
-                json = jsonlib.dumps(topdict)
+                json = jsonlib.dumps_document(topdict)
         else:
-            json = jsonlib.dumps(topdict)
+            json = jsonlib.dumps_document(topdict)
         return json
 
 
@@ -1,5 +1,19 @@
 import os
 
+import redis
+
+_redis = {}
+
 
 def get_full_url(reversed_url):
     return '{0}{1}'.format(os.environ['DOMAIN_URL'], reversed_url)
+
+
+def get_redis(decode_responses=True):
+    if decode_responses not in _redis:
+        _redis[decode_responses] = redis.StrictRedis.from_url(
+            os.environ['REDIS_URL'],
+            decode_responses=decode_responses
+        )
+
+    return _redis[decode_responses]
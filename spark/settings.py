@@ -122,6 +122,71 @@ STATIC_URL = '/static/'
 
 STATICFILES_DIRS = [os.path.join(PROJECT_ROOT, 'static')]
 
+# JSON codec: 'auto' picks the fastest installed of ujson, simplejson and json
+
+JSON_CODEC = os.environ.get('JSON_CODEC', 'auto')
+
+# Metrics settings
+
+METRICS_SAMPLE_SIZE = int(os.environ.get('METRICS_SAMPLE_SIZE', 1000))
+METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 30))
+
+# Outbound HTTP settings
+
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', 10))
+HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', 3))
+HTTP_BACKOFF_BASE = float(os.environ.get('HTTP_BACKOFF_BASE', 0.5))
+HTTP_BACKOFF_MAX = float(os.environ.get('HTTP_BACKOFF_MAX', 30))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 10))
+HTTP_FAN_OUT_WORKERS = int(os.environ.get('HTTP_FAN_OUT_WORKERS', 10))
+
+# Spark API settings
+
+SPARK_PAGE_SIZE = int(os.environ.get('SPARK_PAGE_SIZE', 100))
+
+# Spark room cache settings
+
+ROOM_CACHE_SIZE = int(os.environ.get('ROOM_CACHE_SIZE', 1024))
+ROOM_CACHE_LOCAL_TTL = int(os.environ.get('ROOM_CACHE_LOCAL_TTL', 300))
+ROOM_CACHE_TTL = int(os.environ.get('ROOM_CACHE_TTL', 3600))
+
+# Live meeting state settings
+
+LIVE_STATE_TTL = int(os.environ.get('LIVE_STATE_TTL', 86400))
+
+# Voice response cache settings
+
+VOICE_RESPONSE_CACHE_SIZE = int(os.environ.get('VOICE_RESPONSE_CACHE_SIZE', 256))
+VOICE_RESPONSE_CACHE_TTL = int(os.environ.get('VOICE_RESPONSE_CACHE_TTL', 300))
+
+# Transcript PDF cache settings
+
+TRANSCRIPT_CACHE_TTL = int(os.environ.get('TRANSCRIPT_CACHE_TTL', 86400))
+TRANSCRIPTION_TIMEOUT = int(os.environ.get('TRANSCRIPTION_TIMEOUT', 30))
+
+# Voice PIN settings
+
+VOICE_ID_FALLBACK = os.environ.get('VOICE_ID_FALLBACK', 'false').lower() == 'true'
+VOICE_ID_FALLBACK_DIGITS = int(os.environ.get('VOICE_ID_FALLBACK_DIGITS', 6))
+
+# Webhook settings
+
+WEBHOOK_DEDUP_SIZE = int(os.environ.get('WEBHOOK_DEDUP_SIZE', 4096))
+WEBHOOK_DEDUP_TTL = int(os.environ.get('WEBHOOK_DEDUP_TTL', 600))
+
+# Bot reconciliation settings
+
+UPDATE_BOT_WORKERS = int(os.environ.get('UPDATE_BOT_WORKERS', 10))
+UPDATE_BOT_BATCH_SIZE = int(os.environ.get('UPDATE_BOT_BATCH_SIZE', 100))
+UPDATE_BOT_LOCK_TIMEOUT = int(os.environ.get('UPDATE_BOT_LOCK_TIMEOUT', 300))
+UPDATE_BOT_SWEEP_INTERVAL = int(os.environ.get('UPDATE_BOT_SWEEP_INTERVAL', 3600))
+
+# Beat leader election settings
+
+BEAT_LEADER_TIMEOUT = int(os.environ.get('BEAT_LEADER_TIMEOUT', 30))
+BEAT_LEADER_HEARTBEAT = int(os.environ.get('BEAT_LEADER_HEARTBEAT', 5))
+
 # Celery settings
 
 BROKER_URL = os.environ.setdefault('REDIS_URL', 'URL')
@@ -132,10 +197,47 @@ BROKER_TRANSPORT_OPTIONS = {
 
 CELERY_RESULT_BACKEND = None
 CELERY_TIMEZONE = 'America/New_York'
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_RESULT_SERIALIZER = 'json'
+CELERY_ACCEPT_CONTENT = ['json']
+CELERY_MESSAGE_COMPRESSION = os.environ.get('CELERY_MESSAGE_COMPRESSION') or None
+
+CELERYD_PREFETCH_MULTIPLIER = int(os.environ.get('CELERY_PREFETCH_MULTIPLIER', 4))
+
+CELERY_QUEUES_TIMERS = 'timers'
+CELERY_QUEUES_INTERACTIVE = 'interactive'
+CELERY_QUEUES_RECONCILE = 'reconcile'
+CELERY_QUEUES_DOCUMENTS = 'documents'
+
+CELERY_DEFAULT_QUEUE = CELERY_QUEUES_INTERACTIVE
+
+CELERY_ROUTES = {
+    'meet.tasks.dispatch_timers': {'queue': CELERY_QUEUES_TIMERS},
+    'meet.tasks.fire_timer': {'queue': CELERY_QUEUES_TIMERS},
+    'meet.tasks.probe_queues': {'queue': CELERY_QUEUES_TIMERS},
+    'meet.tasks.process_webhook': {'queue': CELERY_QUEUES_INTERACTIVE},
+    'meet.tasks.stage_meeting': {'queue': CELERY_QUEUES_INTERACTIVE},
+    'meet.tasks.start_meeting': {'queue': CELERY_QUEUES_INTERACTIVE},
+    'meet.tasks.advance_topic': {'queue': CELERY_QUEUES_INTERACTIVE},
+    'meet.tasks.send_topic_warning': {'queue': CELERY_QUEUES_INTERACTIVE},
+    'meet.tasks.update_bot': {'queue': CELERY_QUEUES_RECONCILE},
+    'meet.tasks.prerender_transcript': {'queue': CELERY_QUEUES_DOCUMENTS},
+    'meet.tasks.render_transcript': {'queue': CELERY_QUEUES_DOCUMENTS},
+}
+
+CELERYBEAT_SCHEDULER = 'meet.beat.LeaderScheduler'
 
 CELERYBEAT_SCHEDULE = {
     'update_bot_every_minute': {
-        'task': 'home.tasks.update_bot',
+        'task': 'meet.tasks.update_bot',
         'schedule': timedelta(minutes=1)
     },
+    'dispatch_timers_every_second': {
+        'task': 'meet.tasks.dispatch_timers',
+        'schedule': timedelta(seconds=1)
+    },
+    'probe_queues_every_thirty_seconds': {
+        'task': 'meet.tasks.probe_queues',
+        'schedule': timedelta(seconds=30)
+    },
 }